@@ -0,0 +1,258 @@
+# admission.py
+"""
+Admission control for LLM generations.
+
+Ollama serves a handful of generations at a time. Requests beyond that wait in a
+bounded priority queue instead of piling up until the client times out:
+
+  - interactive requests (/query, /query/stream) are served before batch ones
+    (/query/batch), and batch requests get fewer queue places, so they are
+    turned away first under load
+  - when the queue is full the request is rejected at once (429), and a request
+    that waited longer than the queue timeout gives up (503); both come with a
+    Retry-After estimated from the recent generation time
+  - a waiter that is cancelled (client disconnected) leaves the queue and a
+    generation that is cancelled frees its slot for the next waiter
+
+CircuitBreaker stops sending generations to an Ollama that keeps failing or
+timing out; the API answers extractively from the retrieved sources meanwhile.
+"""
+import heapq
+import math
+import time
+import asyncio
+import itertools
+from collections import Counter
+from contextlib import asynccontextmanager
+
+from metrics import LLM_ACTIVE, LLM_BREAKER_STATE, QUEUE_DEPTH, QUEUE_REJECTED, QUEUE_WAIT_SECONDS
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class Overloaded(Exception):
+    """The generation could not be admitted; maps to an HTTP error with Retry-After."""
+
+    status_code = 503
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFull(Overloaded):
+    status_code = 429
+
+
+class QueueTimeout(Overloaded):
+    status_code = 503
+
+
+class ClientDisconnected(Exception):
+    """The HTTP client went away; its generation was cancelled."""
+
+
+async def cancel_on_disconnect(http_request, awaitable, poll_seconds=0.5):
+    """
+    Awaits `awaitable`, cancelling it if the HTTP client disconnects first.
+
+    Cancelling an Ollama call closes its connection, and Ollama stops generating
+    when the connection drops, so nobody keeps computing an answer no one reads.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_seconds)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                raise ClientDisconnected()
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+
+class GenerationQueue:
+    """
+    Args:
+        max_concurrency: Generations running at the same time
+        queue_limits: Priority class -> how many waiting requests (of any class) still admit one of this class
+        max_wait_seconds: Longest a request waits for a slot (None waits forever)
+    """
+
+    def __init__(self, max_concurrency=2, queue_limits=None, max_wait_seconds=30.0):
+        self.max_concurrency = max_concurrency
+        self.queue_limits = dict(queue_limits or {"interactive": 16, "batch": 8})
+        self.max_wait_seconds = max_wait_seconds
+        self.active = 0
+        self.waiting = Counter()  # priority class -> requests waiting
+        self.rejected = Counter()  # reason -> count
+        self.avg_generation_seconds = None  # moving average, for Retry-After
+        self._waiters = []  # heap of (rank, sequence, priority class, future)
+        self._sequence = itertools.count()
+        self._update_gauges()
+
+    def depth(self):
+        return sum(self.waiting.values())
+
+    def retry_after(self):
+        """Seconds until a slot is likely free: queued work divided over the slots."""
+        per_generation = self.avg_generation_seconds or 5.0
+        return max(1, math.ceil(per_generation * (self.depth() + 1) / self.max_concurrency))
+
+    def check(self, priority="interactive"):
+        """Raises QueueFull if a request of this class would be turned away right now."""
+        if self.active < self.max_concurrency and not self.depth():
+            return
+        if self.depth() >= self.queue_limits[priority]:
+            self._reject(priority, "queue_full")
+            raise QueueFull(f"Too many questions in line ({self.depth()} waiting)", self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, priority="interactive"):
+        """Holds one generation slot for the duration of the block."""
+        started = time.monotonic()
+        await self._acquire(priority)
+        QUEUE_WAIT_SECONDS.labels(priority).observe(time.monotonic() - started)
+        held_from = time.monotonic()
+        try:
+            yield
+        finally:
+            self._record_generation(time.monotonic() - held_from)
+            self._release()
+
+    async def _acquire(self, priority):
+        if self.active < self.max_concurrency and not self.depth():
+            self.active += 1
+            self._update_gauges()
+            return
+        self.check(priority)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITIES[priority], next(self._sequence), priority, future))
+        self.waiting[priority] += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(future, self.max_wait_seconds)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self._release()
+            else:
+                future.cancel()
+                self.waiting[priority] -= 1
+                self._update_gauges()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(priority, "wait_timeout")
+                raise QueueTimeout(f"No generation slot within {self.max_wait_seconds:.0f}s",
+                                   self.retry_after()) from None
+            raise
+
+    def _release(self):
+        self.active -= 1
+        while self._waiters:
+            _, _, priority, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # gave up while waiting
+            self.waiting[priority] -= 1
+            self.active += 1
+            future.set_result(None)
+            break
+        self._update_gauges()
+
+    def _record_generation(self, seconds):
+        if self.avg_generation_seconds is None:
+            self.avg_generation_seconds = seconds
+        else:
+            self.avg_generation_seconds = 0.8 * self.avg_generation_seconds + 0.2 * seconds
+
+    def _reject(self, priority, reason):
+        self.rejected[reason] += 1
+        QUEUE_REJECTED.labels(priority, reason).inc()
+
+    def _update_gauges(self):
+        LLM_ACTIVE.set(self.active)
+        for priority in PRIORITIES:
+            QUEUE_DEPTH.labels(priority).set(self.waiting[priority])
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "waiting": dict(self.waiting),
+            "queue_limits": self.queue_limits,
+            "rejected": dict(self.rejected),
+            "avg_generation_seconds": round(self.avg_generation_seconds or 0.0, 3),
+            "retry_after": self.retry_after(),
+        }
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures; open -> half-open
+    after `reset_seconds`, where a single probe generation is let through: its
+    success closes the breaker, its failure opens it for another `reset_seconds`.
+
+    Args:
+        failure_threshold: Consecutive failures (errors or blown latency budgets) that open the breaker
+        reset_seconds: How long the breaker stays open before probing Ollama again
+    """
+
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, failure_threshold=3, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.trips = 0
+        self._set_state("closed")
+
+    def _set_state(self, state):
+        self.state = state
+        LLM_BREAKER_STATE.set(self.STATES[state])
+
+    def allow(self):
+        """True if a generation may be attempted now; in half-open state only one probe at a time."""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self._set_state("half_open")
+            print("[Breaker] Half-open, probing Ollama")
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != "closed":
+            print("[Breaker] Ollama recovered, closing")
+        self.failures = 0
+        self.probing = False
+        self._set_state("closed")
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+                print(f"[Breaker] Open for {self.reset_seconds:.0f}s after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            self.probing = False
+            self._set_state("open")
+
+    def release_probe(self):
+        """The probe ended without a verdict (cancelled, rejected by the queue): let another one through."""
+        self.probing = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_seconds": self.reset_seconds,
+            "trips": self.trips,
+        }
@@ -1,7 +1,8 @@
 import streamlit as st
 import requests
 import json
-import time
+
+from settings import SAMPLE_QUESTIONS
 
 # --- 1. Page Configuration ---
 st.set_page_config(
@@ -50,13 +51,8 @@ st.caption("Powered by RAG (Llama 3.2 + ChromaDB)")
 
 # === 💡 Sample Questions ===
 
-# List of sample questions
-sample_questions = [
-    "What do investors think about the current crypto market conditions?",
-    "What are people saying about the S&P 500 performance lately?",
-    "What are investors saying about the current state of the real estate market?",
-    "Has JPMorgan Chase made any major announcements in recent weeks?",
-]
+# List of sample questions (shared with the backend, which prewarms its caches with them)
+sample_questions = SAMPLE_QUESTIONS
 
 # Function to handle sample question click: store the question for processing
 def set_sample_prompt(question):
@@ -124,23 +120,39 @@ if prompt:
         full_response = ""
         
         try:
+            sources = []
+            error_message = None
+            degraded = False
+
             with st.spinner("🔍 Searching documents and analyzing..."):
-                # Send request to FastAPI backend
-                response = requests.post(f"{API_URL}/query", json=request_body, timeout=60) 
-                
+                # Stream the answer from the FastAPI backend (NDJSON: sources first, then tokens)
+                response = requests.post(f"{API_URL}/query/stream", json=request_body, stream=True, timeout=60)
+
             if response.status_code == 200:
-                data = response.json()
-                answer = data.get('answer', 'No answer received.')
-                sources = data.get('sources', [])
-                
-                # Simulate streaming response
-                for chunk in answer.split():
-                    full_response += chunk + " "
-                    time.sleep(0.02)
-                    message_placeholder.markdown(full_response + "▌")
-                
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    event = json.loads(line)
+
+                    if event["type"] == "sources":
+                        sources = event.get('sources', [])
+                    elif event["type"] == "token":
+                        full_response += event["content"]
+                        message_placeholder.markdown(full_response + "▌")
+                    elif event["type"] == "error":
+                        error_message = event.get("message", "Unknown error")
+                    elif event["type"] == "done" and event.get("degraded"):
+                        degraded = True
+
+                if not full_response:
+                    full_response = error_message or 'No answer received.'
+
                 # Final display of the complete answer
                 message_placeholder.markdown(full_response)
+                if error_message and full_response != error_message:
+                    st.warning(error_message)
+                if degraded:
+                    st.info("⚡ The language model is slow or unavailable, so this answer was assembled directly from the sources.")
                 
                 # Display Source Documents in an expandable section
                 if sources:
@@ -159,6 +171,10 @@ if prompt:
                 # Save AI response to session history
                 st.session_state.messages.append({"role": "assistant", "content": full_response})
                 
+            elif response.status_code in (429, 503):
+                # Admission control: the backend is at capacity, ask again after Retry-After
+                retry_after = response.headers.get("Retry-After", "a few")
+                st.warning(f"⏳ The assistant is busy right now. Please try again in {retry_after} seconds.")
             else:
                 st.error(f"Backend Error: {response.text}")
                 
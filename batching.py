@@ -0,0 +1,91 @@
+# batching.py
+"""
+Dynamic micro-batching of query encodes.
+
+Concurrent requests each need a single embedding; encoding them one by one wastes
+most of the CPU. The batcher collects questions that arrive within a short window
+(or until the batch is full), encodes them in one call and hands every caller its
+own vector back.
+"""
+import asyncio
+import time
+from collections import Counter
+
+
+class EmbeddingBatcher:
+    """
+    Args:
+        encode_fn: Callable taking a list of texts and returning one vector per text
+        executor: Executor the (blocking) encode_fn runs in
+        max_batch_size: Maximum number of texts encoded in one call
+        max_wait_ms: How long the first text of a batch waits for company
+    """
+
+    def __init__(self, encode_fn, executor, max_batch_size=32, max_wait_ms=5.0):
+        self.encode_fn = encode_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = Counter()  # batch size -> number of batches
+        self.encoded = 0
+        self._queue = None
+        self._worker = None
+
+    async def encode(self, text):
+        """Returns the embedding of `text` as a list of floats."""
+        if self._worker is None:
+            # Created lazily so the queue binds to the server's running event loop
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await loop.run_in_executor(self.executor, self.encode_fn, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batch_sizes[len(batch)] += 1
+            self.encoded += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                # The caller may have gone away (client disconnect) while we were encoding
+                if not future.done():
+                    future.set_result(vector.tolist())
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def stats(self):
+        batches = sum(self.batch_sizes.values())
+        return {
+            "batches": batches,
+            "encoded": self.encoded,
+            "avg_batch_size": round(self.encoded / batches, 2) if batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+        }
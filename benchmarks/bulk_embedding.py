@@ -0,0 +1,127 @@
+# bulk_embedding.py
+"""
+Ingest-side encode throughput: the old loader loop vs. BulkEncoder (embeddings.py).
+
+    loop       - batches of --loop-batch texts in file order, one model.encode() each
+                 (what load_to_chroma.py did before)
+    bucketed   - the whole --window length-sorted, then encoded in one process
+    pool-N     - the same, spread over N worker processes (one per --workers value > 1)
+
+For every mode it reports docs/sec and the speed-up over the loop, and checks
+that the vectors match the loop's row for row (min cosine), i.e. that output
+order is preserved. The share of padding per forward pass, with and without
+sorting, shows how much compute the mixed-length batches waste.
+
+Usage (from the project root):
+    python benchmarks/bulk_embedding.py --docs 4000 --workers 2 4 --output bulk.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embeddings import BACKENDS, BulkEncoder, load_embedding_model
+from settings import INGEST_ENCODE_BATCH_SIZE
+
+DEFAULT_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "data_collector", "yahoo_finance_data.jsonl")
+
+
+def read_texts(path, limit):
+    texts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            texts.append(json.loads(line)['text'])
+            if len(texts) >= limit:
+                break
+    return texts
+
+
+def padding_share(lengths, batch_size):
+    """Fraction of the (batch x longest) token grid that is padding, for batches in the given order."""
+    padded = real = 0
+    for i in range(0, len(lengths), batch_size):
+        batch = lengths[i:i + batch_size]
+        padded += max(batch) * len(batch)
+        real += sum(batch)
+    return 1 - real / padded if padded else 0.0
+
+
+def min_cosine(a, b):
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return float(np.min(np.sum(a * b, axis=1)))
+
+
+def encode_loop(model, texts, loop_batch, batch_size):
+    vectors = [model.encode(texts[i:i + loop_batch], batch_size=batch_size, show_progress_bar=False,
+                            convert_to_numpy=True)
+               for i in range(0, len(texts), loop_batch)]
+    return np.vstack(vectors)
+
+
+def encode_bulk(encoder, texts, window):
+    return np.vstack([encoder.encode(texts[i:i + window]) for i in range(0, len(texts), window)])
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=DEFAULT_DATA, help="JSONL file with a 'text' field per line")
+    parser.add_argument("--docs", type=int, default=4000)
+    parser.add_argument("--backend", choices=BACKENDS, default=None)
+    parser.add_argument("--loop-batch", type=int, default=100, help="Batch size of the old loader loop")
+    parser.add_argument("--window", type=int, default=1000, help="Texts sorted together (loader --batch-size)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_ENCODE_BATCH_SIZE, help="Texts per forward pass")
+    parser.add_argument("--workers", type=int, nargs="*", default=[2, 4], help="Pool sizes to try")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    texts = read_texts(args.data, args.docs)
+    model = load_embedding_model(args.backend)
+    model.encode(texts[:args.batch_size], show_progress_bar=False)  # warm up
+
+    tokenized = model.tokenizer(texts, truncation=True, max_length=model.max_seq_length)
+    token_lengths = [len(ids) for ids in tokenized["input_ids"]]
+    order = BulkEncoder.length_order(texts)
+    padding = {
+        "file_order": round(padding_share(token_lengths, args.batch_size), 3),
+        "length_sorted": round(padding_share([token_lengths[i] for i in order], args.batch_size), 3),
+    }
+    print(f"📄 {len(texts)} texts, {np.mean(token_lengths):.0f} tokens on average; padding per forward pass: "
+          f"{padding['file_order']:.0%} in file order, {padding['length_sorted']:.0%} length-sorted")
+
+    reference, loop_seconds = timed(encode_loop, model, texts, args.loop_batch, args.batch_size)
+    results = {"loop": {"docs_per_s": round(len(texts) / loop_seconds, 1), "speedup": 1.0, "min_cosine": 1.0}}
+
+    modes = [("bucketed", 1)] + [(f"pool-{n}", n) for n in args.workers if n > 1]
+    for name, workers in modes:
+        with BulkEncoder(model, workers=workers, batch_size=args.batch_size) as encoder:
+            encoder.encode(texts[:args.batch_size])  # workers load their model copy before timing
+            vectors, seconds = timed(encode_bulk, encoder, texts, args.window)
+        results[name] = {
+            "docs_per_s": round(len(texts) / seconds, 1),
+            "speedup": round(loop_seconds / seconds, 2),
+            "min_cosine": round(min_cosine(vectors, reference), 5),
+        }
+
+    print(f"\n{'mode':<10} {'docs/s':>9} {'speed-up':>9} {'min cos':>9}")
+    for name, row in results.items():
+        print(f"{name:<10} {row['docs_per_s']:>9} {row['speedup']:>8}x {row['min_cosine']:>9}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"config": vars(args), "padding": padding, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# embedding_backends.py
+"""
+Parity check and encode benchmark for the embedding backends in embeddings.py.
+
+For every backend it reports:
+  - cosine similarity against the PyTorch vectors for the same texts (mean / min)
+  - single-query latency (p50 / p95), the query-time workload of main.py
+  - batch throughput in docs/sec, the ingest workload of load_to_chroma.py
+
+Exits with status 1 if any backend drifts below --min-cosine from PyTorch, so it
+can gate a switch of EMBEDDING_BACKEND.
+
+Usage (from the project root):
+    python benchmarks/embedding_backends.py --backends torch onnx onnx-int8 --docs 500
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embeddings import BACKENDS, load_embedding_model
+from settings import SAMPLE_QUESTIONS
+
+DEFAULT_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "data_collector", "yahoo_finance_data.jsonl")
+
+
+def read_texts(path, limit):
+    texts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            texts.append(json.loads(line)['text'])
+            if len(texts) >= limit:
+                break
+    return texts
+
+
+def percentile(values, pct):
+    return float(np.percentile(np.asarray(values), pct) * 1000)
+
+
+def bench_backend(model, queries, docs, batch_size):
+    # Warm up (first call pays graph/session initialisation)
+    model.encode(queries[:2], show_progress_bar=False)
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        model.encode(query, show_progress_bar=False)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    doc_vecs = model.encode(docs, batch_size=batch_size, show_progress_bar=False, normalize_embeddings=True)
+    elapsed = time.perf_counter() - started
+
+    return doc_vecs, {
+        "query_p50_ms": round(percentile(latencies, 50), 2),
+        "query_p95_ms": round(percentile(latencies, 95), 2),
+        "docs_per_sec": round(len(docs) / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--data", default=DEFAULT_DATA, help="JSONL file with a 'text' field per line")
+    parser.add_argument("--docs", type=int, default=500, help="Documents used for throughput and parity")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--min-cosine", type=float, default=0.98,
+                        help="Fail if any document's cosine vs PyTorch drops below this")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    docs = read_texts(args.data, args.docs)
+    queries = SAMPLE_QUESTIONS * 5
+    print(f"Benchmarking {args.backends} on {len(docs)} docs / {len(queries)} queries\n")
+
+    # PyTorch runs first: its vectors are the parity reference
+    backends = sorted(args.backends, key=lambda b: b != "torch")
+    reference = None
+    if "torch" not in backends:
+        reference, _ = bench_backend(load_embedding_model("torch"), queries[:2], docs, args.batch_size)
+
+    results = {}
+    failed = False
+    for backend in backends:
+        print(f"📊 {backend}...")
+        started = time.perf_counter()
+        model = load_embedding_model(backend)
+        load_seconds = time.perf_counter() - started
+
+        doc_vecs, stats = bench_backend(model, queries, docs, args.batch_size)
+        stats["load_seconds"] = round(load_seconds, 2)
+        if backend == "torch":
+            reference = doc_vecs
+
+        # Vectors are normalized, so the row-wise dot product is the cosine similarity
+        cosines = np.sum(doc_vecs * reference, axis=1)
+        stats["cosine_mean"] = round(float(cosines.mean()), 5)
+        stats["cosine_min"] = round(float(cosines.min()), 5)
+        stats["parity_ok"] = bool(cosines.min() >= args.min_cosine)
+        failed = failed or not stats["parity_ok"]
+        results[backend] = stats
+
+    print(f"\n{'backend':<10} {'load s':>7} {'q p50 ms':>9} {'q p95 ms':>9} {'docs/s':>8} {'cos mean':>9} {'cos min':>8}")
+    for backend, stats in results.items():
+        print(f"{backend:<10} {stats['load_seconds']:>7} {stats['query_p50_ms']:>9} {stats['query_p95_ms']:>9} "
+              f"{stats['docs_per_sec']:>8} {stats['cosine_mean']:>9} {stats['cosine_min']:>8}"
+              f"{'' if stats['parity_ok'] else '  <-- drift above bound'}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# embedding_sharing.py
+"""
+Per-worker memory and encode latency of the EMBEDDING_SHARING modes.
+
+Starts --workers processes the way the API would run them and lets each one
+encode the sample questions concurrently:
+
+    none     - spawned workers, each loads its own SentenceTransformer
+    preload  - the model is loaded once, then workers are forked (gunicorn --preload)
+    sidecar  - spawned workers without torch, encoding through embedding_server.py
+
+While all workers are alive it reads RSS and PSS from /proc/<pid>/smaps_rollup
+(Linux only). PSS splits shared pages between the processes that map them, so
+its sum is the real footprint; RSS counts shared pages once per worker. Encode
+latency is measured inside the workers (p50 / p95 of single-question calls).
+
+Usage (from the project root):
+    python benchmarks/embedding_sharing.py --workers 4 --modes none preload sidecar --output sharing.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import multiprocessing as mp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from settings import SAMPLE_QUESTIONS
+
+_preloaded = None  # model loaded by the parent in preload mode, inherited by forked workers
+
+
+def memory_mb(pid):
+    """{"rss_mb", "pss_mb"} of a process from /proc/<pid>/smaps_rollup."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[f"{key.lower()}_mb"] = round(int(rest.split()[0]) / 1024, 1)
+    return values
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def worker(mode, socket_path, rounds, ready, done, results):
+    if mode == "sidecar":
+        from embedding_server import EmbeddingClient
+        model = EmbeddingClient(socket_path)
+        model.wait_until_ready()
+    elif mode == "preload":
+        model = _preloaded
+    else:
+        from embeddings import load_embedding_model
+        model = load_embedding_model()
+
+    model.encode(SAMPLE_QUESTIONS[:1], show_progress_bar=False)
+    latencies = []
+    for _ in range(rounds):
+        for question in SAMPLE_QUESTIONS:
+            started = time.perf_counter()
+            model.encode([question], show_progress_bar=False)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    ready.wait()  # every worker is loaded: shared pages are now counted in everyone's PSS
+    results.put({"pid": os.getpid(), "torch_loaded": "torch" in sys.modules, **memory_mb(os.getpid()),
+                 "encode_p50_ms": round(percentile(latencies, 50), 2),
+                 "encode_p95_ms": round(percentile(latencies, 95), 2)})
+    done.wait()
+
+
+def run_mode(mode, workers, rounds):
+    global _preloaded
+    ctx = mp.get_context("fork" if mode == "preload" else "spawn")
+    ready, done, results = ctx.Barrier(workers), ctx.Barrier(workers + 1), ctx.Queue()
+    sidecar, socket_path = None, os.path.join(tempfile.mkdtemp(), "embeddings.sock")
+
+    if mode == "preload":
+        from embeddings import load_embedding_model
+        _preloaded = load_embedding_model()
+    elif mode == "sidecar":
+        sidecar = subprocess.Popen([sys.executable, os.path.join(ROOT, "embedding_server.py"),
+                                    "--socket", socket_path], cwd=ROOT)
+
+    processes = [ctx.Process(target=worker, args=(mode, socket_path, rounds, ready, done, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    rows = [results.get() for _ in processes]
+    extra = {"sidecar": memory_mb(sidecar.pid)} if sidecar else {}
+    done.wait()
+    for process in processes:
+        process.join()
+    if sidecar:
+        sidecar.terminate()
+        sidecar.wait()
+    _preloaded = None
+
+    total_pss = sum(row["pss_mb"] for row in rows) + sum(m["pss_mb"] for m in extra.values())
+    return {"workers": rows, **extra, "total_pss_mb": round(total_pss, 1),
+            "encode_p50_ms": round(sum(row["encode_p50_ms"] for row in rows) / len(rows), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=["none", "preload", "sidecar"],
+                        default=["none", "preload", "sidecar"])
+    parser.add_argument("--rounds", type=int, default=25, help="Passes over the sample questions per worker")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'mode':<8} {'worker RSS MB':>14} {'worker PSS MB':>14} {'total PSS MB':>13} {'encode p50 ms':>14}")
+    for mode in args.modes:
+        stats = run_mode(mode, args.workers, args.rounds)
+        results[mode] = stats
+        rss = sum(row["rss_mb"] for row in stats["workers"]) / args.workers
+        pss = sum(row["pss_mb"] for row in stats["workers"]) / args.workers
+        print(f"{mode:<8} {rss:>14.1f} {pss:>14.1f} {stats['total_pss_mb']:>13} {stats['encode_p50_ms']:>14}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# hnsw_sweep.py
+"""
+Recall vs. latency of Chroma's HNSW index for the finance_documents embeddings.
+
+Ground truth is an exact brute-force top-k (NumPy) over every stored embedding,
+in the collection's distance space. The script measures the existing collection
+as it is, then rebuilds the same vectors in throwaway collections for every
+combination of M, construction_ef and search_ef, and reports for each one:
+  - recall@k against the exact top-k
+  - query latency (p50 / p95) of collection.query
+  - build time and index size (on disk, and the hnswlib in-memory estimate)
+
+Queries are the app's questions (SAMPLE_QUESTIONS + FREQUENT_QUERIES_FILE, encoded
+with the configured embedding model) plus a random sample of stored documents.
+
+The cheapest configuration that reaches --target-recall is printed as HNSW_*
+settings; load_to_chroma.py creates the collection with those (settings.hnsw_metadata).
+M and construction_ef only apply to a newly created collection.
+
+Usage (from the project root):
+    python benchmarks/hnsw_sweep.py --k 10 --target-recall 0.98 --output hnsw.json
+    python benchmarks/hnsw_sweep.py --m 8 16 32 --construction-ef 100 200 --search-ef 10 50 100 200
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import itertools
+
+import chromadb
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embeddings import load_embedding_model
+from settings import CHROMA_PATH, COLLECTION_NAME, prewarm_queries
+
+
+def load_collection_vectors(collection, page_size=1000):
+    ids, embeddings = [], []
+    for offset in range(0, collection.count(), page_size):
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        ids.extend(page['ids'])
+        embeddings.extend(page['embeddings'])
+    return ids, np.asarray(embeddings, dtype=np.float32)
+
+
+def exact_top_k(vectors, queries, k, space):
+    """Indices of the k nearest stored vectors per query, computed by brute force."""
+    if space == "cosine":
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        distances = -queries @ vectors.T
+    elif space == "ip":
+        distances = -queries @ vectors.T
+    else:
+        # Squared L2 without the per-query constant |q|^2
+        distances = (vectors ** 2).sum(axis=1)[None, :] - 2 * queries @ vectors.T
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def measure_queries(collection, queries, truth_ids, k):
+    latencies, recalls = [], []
+    for query, truth in zip(queries, truth_ids):
+        started = time.perf_counter()
+        found = collection.query(query_embeddings=[query.tolist()], n_results=k, include=["distances"])
+        latencies.append(time.perf_counter() - started)
+        recalls.append(len(set(found['ids'][0]) & truth) / k)
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "recall": round(float(np.mean(recalls)), 4),
+        "min_recall": round(float(np.min(recalls)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+def directory_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files if name != "chroma.sqlite3")
+    return round(total / 1e6, 2)
+
+
+def estimated_index_mb(count, dim, m):
+    # hnswlib layer 0: vector + 2*M links + link count + label per element; upper layers add ~1/M of that
+    per_element = dim * 4 + 2 * m * 4 + 4 + 8
+    return round(count * per_element * (1 + 1 / m) / 1e6, 2)
+
+
+def build_and_measure(ids, vectors, queries, truth_ids, k, space, m, construction_ef, search_ef, batch_size):
+    workdir = tempfile.mkdtemp(prefix="hnsw_sweep_")
+    try:
+        client = chromadb.PersistentClient(path=workdir)
+        collection = client.create_collection(
+            name="hnsw_sweep",
+            metadata={"hnsw:space": space, "hnsw:M": m, "hnsw:construction_ef": construction_ef,
+                      "hnsw:search_ef": search_ef},
+        )
+        started = time.perf_counter()
+        for i in range(0, len(ids), batch_size):
+            collection.add(ids=ids[i:i + batch_size], embeddings=vectors[i:i + batch_size].tolist())
+        build_seconds = time.perf_counter() - started
+
+        result = measure_queries(collection, queries, truth_ids, k)
+        result.update({
+            "M": m, "construction_ef": construction_ef, "search_ef": search_ef,
+            "build_s": round(build_seconds, 2),
+            "disk_mb": directory_mb(workdir),
+            "index_mb_estimate": estimated_index_mb(len(ids), vectors.shape[1], m),
+        })
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def choose(results, target_recall):
+    """Fastest configuration at or above the target recall (smaller index breaks ties); None if none reaches it."""
+    eligible = [r for r in results if r["recall"] >= target_recall]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda r: (r["p50_ms"], r["index_mb_estimate"], r["search_ef"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chroma-path", default=CHROMA_PATH)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query (recall@k)")
+    parser.add_argument("--doc-queries", type=int, default=200, help="Stored documents sampled as extra queries")
+    parser.add_argument("--m", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--target-recall", type=float, default=0.98)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    collection = chromadb.PersistentClient(path=args.chroma_path).get_collection(args.collection)
+    metadata = collection.metadata or {}
+    space = metadata.get("hnsw:space", "l2")
+    ids, vectors = load_collection_vectors(collection)
+    print(f"📁 {len(ids)} vectors ({vectors.shape[1]} dims, space={space}) from {args.collection}")
+
+    model = load_embedding_model()
+    question_vecs = model.encode(prewarm_queries(), show_progress_bar=False, convert_to_numpy=True)
+    rng = np.random.default_rng(args.seed)
+    sampled = rng.choice(len(ids), size=min(args.doc_queries, len(ids)), replace=False)
+    queries = np.vstack([question_vecs.astype(np.float32), vectors[sampled]])
+
+    started = time.perf_counter()
+    truth = exact_top_k(vectors, queries, args.k, space)
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    truth_ids = [{ids[i] for i in row} for row in truth]
+    print(f"🎯 Exact top-{args.k} for {len(queries)} queries ({exact_ms:.3f} ms/query brute force)\n")
+
+    current = measure_queries(collection, queries, truth_ids, args.k)
+    current.update({key.replace("hnsw:", ""): value for key, value in metadata.items() if key.startswith("hnsw:")})
+    print(f"Current collection: recall@{args.k}={current['recall']} p50={current['p50_ms']} ms "
+          f"(settings: {metadata or 'Chroma defaults'})\n")
+
+    results = []
+    print(f"{'M':>4} {'ef_c':>5} {'ef_s':>5} {'recall':>7} {'min':>6} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'build s':>8} {'disk MB':>8} {'mem MB':>7}")
+    for m, construction_ef, search_ef in itertools.product(args.m, args.construction_ef, args.search_ef):
+        r = build_and_measure(ids, vectors, queries, truth_ids, args.k, space, m, construction_ef, search_ef,
+                              args.batch_size)
+        results.append(r)
+        print(f"{m:>4} {construction_ef:>5} {search_ef:>5} {r['recall']:>7} {r['min_recall']:>6} "
+              f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['build_s']:>8} {r['disk_mb']:>8} {r['index_mb_estimate']:>7}")
+
+    chosen = choose(results, args.target_recall)
+    if chosen is None:
+        print(f"\n❌ No configuration reached recall@{args.k} >= {args.target_recall}; widen the sweep.")
+    else:
+        print(f"\n✅ Fastest configuration with recall@{args.k} >= {args.target_recall}:")
+        print(f"   HNSW_M={chosen['M']} HNSW_CONSTRUCTION_EF={chosen['construction_ef']} "
+              f"HNSW_SEARCH_EF={chosen['search_ef']}")
+        print("   Set these (settings.py or env) and rebuild the collection with data_collector/load_to_chroma.py.")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "config": vars(args), "documents": len(ids), "dimensions": int(vectors.shape[1]), "space": space,
+                "queries": len(queries), "exact_ms_per_query": round(exact_ms, 3),
+                "current": current, "results": results, "chosen": chosen,
+            }, f, indent=2)
+
+    sys.exit(0 if chosen is not None else 1)
+
+
+if __name__ == "__main__":
+    main()
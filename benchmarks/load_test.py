@@ -0,0 +1,286 @@
+# load_test.py
+"""
+End-to-end load test of the query API with Ollama replaced by a stub.
+
+The backend either runs in this process (uvicorn on a free port, OLLAMA_HOST
+pointed at benchmarks/stub_ollama.py) or is an already running server given with
+--url. Requests replay a query corpus - a JSONL/text file (--queries), the
+SAMPLE_QUESTIONS shared with app.py, FREQUENT_QUERIES_FILE and synthetic
+paraphrases of those - from --concurrency closed-loop clients.
+
+Every request asks for include_timings, so the report contains throughput,
+latency percentiles and a per-stage breakdown (encode, retrieve, context,
+generate, TTFT, ...). The same numbers are written as JSON to --output, so two
+runs can be diffed before a deploy.
+
+Usage (from the project root, with the Chroma DB in place):
+    python benchmarks/load_test.py --requests 200 --concurrency 8 --output load.json
+    python benchmarks/load_test.py --endpoint stream --stub-tokens-per-second 20
+    python benchmarks/load_test.py --url http://localhost:8000 --requests 100   # stub not used
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from stub_ollama import StubOllama
+
+PARAPHRASES = [
+    "{q}",
+    "Can you tell me: {q}",
+    "Quick question - {q}",
+    "{q} Please keep it short.",
+    "I'd like to know {lower}",
+    "Give me an overview. {q}",
+]
+
+
+def read_queries(path):
+    """Questions from a .jsonl file ("question"/"query"/"text" field per line) or a plain text file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if not path.endswith(".jsonl"):
+        return [line for line in lines if not line.startswith("#")]
+    questions = []
+    for line in lines:
+        record = json.loads(line)
+        question = next((record[key] for key in ("question", "query", "text") if record.get(key)), None)
+        if question:
+            questions.append(question)
+    return questions
+
+
+def build_corpus(query_file=None, paraphrases=True):
+    from settings import SAMPLE_QUESTIONS, prewarm_queries
+
+    base = list(dict.fromkeys(SAMPLE_QUESTIONS + prewarm_queries() + (read_queries(query_file) if query_file else [])))
+    if not paraphrases:
+        return base
+    corpus = []
+    for question in base:
+        lower = question[0].lower() + question[1:]
+        corpus.extend(template.format(q=question, lower=lower) for template in PARAPHRASES)
+    return corpus
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_backend(stub_url, answer_cache, ready_timeout):
+    """Imports main.py against the stub and serves it from a background thread; returns (url, server)."""
+    import ollama
+    import uvicorn
+
+    os.chdir(ROOT)
+    import main
+
+    # settings.py was already imported (build_corpus) before the stub's URL was known, so the
+    # environment is too late here: point main's own objects at the stub / disable the cache
+    main.ollama_client = ollama.AsyncClient(host=stub_url)
+    if not answer_cache:
+        main.answer_cache.threshold = 2  # cosine similarity never reaches 2: every lookup misses
+    app = main.app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+
+    url = f"http://127.0.0.1:{port}"
+    wait_until_ready(url, ready_timeout)
+    return url, server
+
+
+def wait_until_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = requests.get(f"{url}/readyz", timeout=2)
+            if response.status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} was not ready after {timeout}s")
+
+
+def send_query(session, url, endpoint, question, n_results, timeout):
+    """Runs one request and returns a result record (latency, status, server-side timings)."""
+    payload = {"question": question, "n_results": n_results, "include_timings": True}
+    started = time.perf_counter()
+    record = {"ok": False, "cached": False, "degraded": False, "timings": {}}
+    try:
+        if endpoint == "stream":
+            with session.post(f"{url}/query/stream", json=payload, stream=True, timeout=timeout) as response:
+                record["status"] = response.status_code
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "token" and "client_ttft_ms" not in record:
+                        record["client_ttft_ms"] = (time.perf_counter() - started) * 1000
+                    elif event["type"] == "done":
+                        record["ok"] = True
+                        record["degraded"] = bool(event.get("degraded"))
+                        record["cached"] = bool(event.get("cached"))
+                        record["timings"] = event.get("timings") or {}
+        else:
+            response = session.post(f"{url}/query", json=payload, timeout=timeout)
+            record["status"] = response.status_code
+            if response.status_code == 200:
+                body = response.json()
+                record["ok"] = True
+                record["degraded"] = body.get("degraded", False)
+                record["cached"] = body.get("cached", False)
+                record["timings"] = body.get("timings") or {}
+    except requests.RequestException as e:
+        record["status"] = type(e).__name__
+    record["latency_ms"] = (time.perf_counter() - started) * 1000
+    return record
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pct(p):
+        return round(values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))], 2)
+
+    return {
+        "mean": round(statistics.mean(values), 2),
+        "p50": pct(50), "p90": pct(90), "p95": pct(95), "p99": pct(99),
+        "max": round(values[-1], 2),
+    }
+
+
+def run_load(url, endpoint, corpus, total, concurrency, n_results, timeout, warmup):
+    local = threading.local()
+
+    def worker(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return send_query(local.session, url, endpoint, corpus[i % len(corpus)], n_results, timeout)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(warmup)))
+        started = time.perf_counter()
+        records = list(pool.map(worker, range(warmup, warmup + total)))
+        elapsed = time.perf_counter() - started
+    return records, elapsed
+
+
+def summarize(records, elapsed):
+    ok = [r for r in records if r["ok"]]
+    statuses = {}
+    for r in records:
+        statuses[str(r.get("status"))] = statuses.get(str(r.get("status")), 0) + 1
+
+    stage_keys = sorted({key for r in ok for key, value in r["timings"].items() if isinstance(value, (int, float))})
+    stages = {key: percentiles([r["timings"][key] for r in ok if key in r["timings"]]) for key in stage_keys}
+    client_ttft = [r["client_ttft_ms"] for r in ok if "client_ttft_ms" in r]
+
+    return {
+        "requests": len(records),
+        "succeeded": len(ok),
+        "failed": len(records) - len(ok),
+        "cached": sum(r["cached"] for r in ok),
+        "degraded": sum(r["degraded"] for r in ok),
+        "statuses": statuses,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": percentiles([r["latency_ms"] for r in ok]),
+        "client_ttft_ms": percentiles(client_ttft),
+        "stages_ms": stages,
+    }
+
+
+def print_report(summary):
+    latency = summary["latency_ms"]
+    print(f"\n📊 {summary['succeeded']}/{summary['requests']} ok in {summary['duration_s']}s "
+          f"-> {summary['throughput_rps']} req/s (cached: {summary['cached']}, degraded: {summary['degraded']}, statuses: {summary['statuses']})")
+    if not latency:
+        return
+    print(f"\n{'metric':<24} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    rows = [("latency_ms", latency)]
+    if summary["client_ttft_ms"]:
+        rows.append(("client_ttft_ms", summary["client_ttft_ms"]))
+    rows.extend(summary["stages_ms"].items())
+    for name, stats in rows:
+        print(f"{name:<24} {stats['mean']:>9} {stats['p50']:>9} {stats['p90']:>9} {stats['p99']:>9} {stats['max']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Target a running backend instead of starting one in-process")
+    parser.add_argument("--endpoint", choices=["query", "stream"], default="query")
+    parser.add_argument("--queries", help="Extra questions: .jsonl with a question field per line, or plain text")
+    parser.add_argument("--no-paraphrases", action="store_true", help="Replay the corpus without synthetic variants")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10, help="Requests sent before measuring")
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the semantic answer cache on (in-process only)")
+    parser.add_argument("--stub-tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--stub-latency-ms", type=float, default=150.0)
+    parser.add_argument("--stub-prefill-tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--stub-tokens", type=int, default=64)
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.queries, paraphrases=not args.no_paraphrases)
+    print(f"📝 Corpus: {len(corpus)} questions")
+
+    stub = server = None
+    url = args.url
+    if not url:
+        stub = StubOllama(port=0, tokens_per_second=args.stub_tokens_per_second, latency_ms=args.stub_latency_ms,
+                          prefill_tokens_per_second=args.stub_prefill_tokens_per_second,
+                          tokens=args.stub_tokens).start()
+        print(f"🤖 Stub Ollama on {stub.url}; starting backend in-process...")
+        url, server = start_backend(stub.url, args.answer_cache, args.ready_timeout)
+    print(f"🚀 {args.requests} x {args.endpoint} against {url} with {args.concurrency} clients")
+
+    try:
+        records, elapsed = run_load(url, args.endpoint, corpus, args.requests, args.concurrency,
+                                    args.n_results, args.timeout, args.warmup)
+    finally:
+        if server is not None:
+            server.should_exit = True
+        if stub is not None:
+            stub.stop()
+
+    summary = summarize(records, elapsed)
+    print_report(summary)
+    if stub is not None and not args.answer_cache and summary["cached"]:
+        print(f"⚠️  {summary['cached']} answers came from the answer cache although it should be off")
+
+    if args.output:
+        results = {
+            "config": {key: value for key, value in vars(args).items() if key != "output"},
+            "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                            "cpus": os.cpu_count()},
+            "stub": stub.stats() if stub else None,
+            "summary": summary,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# prompt_ttft.py
+"""
+Time-to-first-token of the old and new prompt layouts against a running Ollama.
+
+    legacy - one user message with the per-request context in the middle of the
+             instructions (the layout main.py used before prompts.py)
+    prefix - fixed system message + variable user message (prompts.build_messages)
+
+Each run uses a different question/context, like real traffic. With the prefix
+layout Ollama can reuse the cached instruction prefix, so prompt_eval_duration and
+TTFT drop after the first request.
+
+Usage (from the project root, with `ollama serve` running):
+    python benchmarks/prompt_ttft.py --runs 10 --model llama3.2:3b
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+import ollama
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prompts import SYSTEM_PROMPT, build_messages
+from settings import DEFAULT_MODEL, OLLAMA_HOST, OLLAMA_KEEP_ALIVE, OLLAMA_NUM_CTX, SAMPLE_QUESTIONS
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "data_collector", "yahoo_finance_data.jsonl")
+
+
+def legacy_messages(question, context):
+    instructions, rules = SYSTEM_PROMPT.split("# RULES #")
+    content = (f"{instructions}# RESPONSE #\n"
+               f"Context:\n{context}\n\nQuery:\n{question}\n\n"
+               f"Rules:{rules}\nAnswer:")
+    return [{"role": "user", "content": content}]
+
+
+def read_contexts(runs, docs_per_context=5):
+    with open(DATA_FILE, 'r', encoding='utf-8') as f:
+        texts = [json.loads(line)['text'] for _, line in zip(range(runs * docs_per_context), f)]
+    return ["".join(f"- {text}\n" for text in texts[i:i + docs_per_context])
+            for i in range(0, len(texts), docs_per_context)]
+
+
+def measure(client, model, messages):
+    started = time.perf_counter()
+    ttft = None
+    final = None
+    for chunk in client.chat(model=model, messages=messages, stream=True,
+                             options={"num_ctx": OLLAMA_NUM_CTX, "num_predict": 32},
+                             keep_alive=OLLAMA_KEEP_ALIVE):
+        if ttft is None and chunk["message"]["content"]:
+            ttft = time.perf_counter() - started
+        if chunk.get("done"):
+            final = chunk
+    return {
+        "ttft_ms": (ttft or 0) * 1000,
+        "prompt_eval_count": final.get("prompt_eval_count") or 0,
+        "prompt_eval_ms": (final.get("prompt_eval_duration") or 0) / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    client = ollama.Client(host=OLLAMA_HOST)
+    contexts = read_contexts(args.runs)
+    questions = [SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)] for i in range(args.runs)]
+    layouts = {"legacy": legacy_messages, "prefix": build_messages}
+
+    # Make sure the model is loaded so neither layout pays the load time
+    client.chat(model=args.model, messages=build_messages("Hello", ""),
+                options={"num_ctx": OLLAMA_NUM_CTX, "num_predict": 1}, keep_alive=OLLAMA_KEEP_ALIVE)
+
+    results = {}
+    for name, make_messages in layouts.items():
+        runs = [measure(client, args.model, make_messages(q, c)) for q, c in zip(questions, contexts)]
+        results[name] = {
+            "ttft_p50_ms": round(statistics.median(r["ttft_ms"] for r in runs), 1),
+            "ttft_max_ms": round(max(r["ttft_ms"] for r in runs), 1),
+            "prompt_eval_ms_mean": round(statistics.mean(r["prompt_eval_ms"] for r in runs), 1),
+            "prompt_tokens_mean": round(statistics.mean(r["prompt_eval_count"] for r in runs), 1),
+        }
+
+    print(f"\n{'layout':<8} {'TTFT p50 ms':>12} {'TTFT max ms':>12} {'prefill ms':>11} {'prompt tok':>11}")
+    for name, stats in results.items():
+        print(f"{name:<8} {stats['ttft_p50_ms']:>12} {stats['ttft_max_ms']:>12} "
+              f"{stats['prompt_eval_ms_mean']:>11} {stats['prompt_tokens_mean']:>11}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
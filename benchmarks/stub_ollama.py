@@ -0,0 +1,193 @@
+# stub_ollama.py
+"""
+Minimal stand-in for the Ollama HTTP API, for load tests that should measure the
+RAG pipeline rather than the GPU.
+
+Implements the endpoints main.py uses (POST /api/chat, streaming and not) plus
+/api/tags and /api/version. Each chat call waits `latency_ms` plus a prefill time
+proportional to the prompt, then emits `tokens` tokens at `tokens_per_second`. The
+final message carries the same counters as Ollama (prompt_eval_count, eval_count,
+*_duration in nanoseconds), so /metrics and the timings block work unchanged.
+
+Standalone (then start the backend with OLLAMA_HOST=http://127.0.0.1:11435):
+    python benchmarks/stub_ollama.py --port 11435 --tokens-per-second 40 --latency-ms 150
+"""
+import json
+import math
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = "The company reported results broadly in line with expectations for the quarter".split()
+
+
+class StubOllama:
+    """
+    Args:
+        port: Port to listen on (0 picks a free one)
+        tokens_per_second: Generation speed
+        latency_ms: Fixed delay before the first token (model/queue overhead)
+        prefill_tokens_per_second: Prompt evaluation speed; adds prompt_tokens / rate to the first-token delay
+        tokens: Completion length of every answer
+    """
+
+    def __init__(self, port=11435, tokens_per_second=40.0, latency_ms=150.0,
+                 prefill_tokens_per_second=2000.0, tokens=64, host="127.0.0.1"):
+        self.tokens_per_second = tokens_per_second
+        self.latency_ms = latency_ms
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.tokens = tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "tokens_per_second": self.tokens_per_second,
+            "latency_ms": self.latency_ms,
+            "prefill_tokens_per_second": self.prefill_tokens_per_second,
+            "tokens": self.tokens,
+        }
+
+    def _count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def chat(self, body):
+        """Yields (content, final_fields) per token; final_fields is set on the last one only."""
+        self._count_request()
+        prompt = "".join(message.get("content", "") for message in body.get("messages", []))
+        prompt_tokens = math.ceil(len(prompt) / 4)
+        num_predict = (body.get("options") or {}).get("num_predict")
+        tokens = min(self.tokens, num_predict) if num_predict and num_predict > 0 else self.tokens
+
+        started = time.perf_counter()
+        prefill = prompt_tokens / self.prefill_tokens_per_second if self.prefill_tokens_per_second else 0.0
+        time.sleep(self.latency_ms / 1000 + prefill)
+        first_token = time.perf_counter()
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+        for i in range(tokens):
+            if i:
+                time.sleep(interval)
+            content = FILLER[i % len(FILLER)] + " "
+            if i < tokens - 1:
+                yield content, None
+        finished = time.perf_counter()
+        yield (content if tokens else ""), {
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((finished - started) * 1e9),
+            "load_duration": int(self.latency_ms * 1e6),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prefill * 1e9),
+            "eval_count": tokens,
+            "eval_duration": int((finished - first_token) * 1e9),
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": []})
+                elif self.path == "/api/version":
+                    self._send_json({"version": "stub"})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path != "/api/chat":
+                    self._send_json({"error": f"{self.path} is not implemented by the stub"}, status=404)
+                    return
+
+                def message(content, final):
+                    payload = {
+                        "model": body.get("model", "stub"),
+                        "created_at": datetime.now(timezone.utc).isoformat(),
+                        "message": {"role": "assistant", "content": content},
+                        "done": False,
+                    }
+                    payload.update(final or {})
+                    return payload
+
+                if not body.get("stream", True):
+                    answer, final = [], None
+                    for content, final in stub.chat(body):
+                        answer.append(content)
+                    self._send_json(message("".join(answer), final))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for content, final in stub.chat(body):
+                    line = (json.dumps(message(content, final)) + "\n").encode()
+                    self.wfile.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--tokens", type=int, default=64, help="Completion tokens per answer")
+    args = parser.parse_args()
+
+    stub = StubOllama(port=args.port, tokens_per_second=args.tokens_per_second, latency_ms=args.latency_ms,
+                      prefill_tokens_per_second=args.prefill_tokens_per_second, tokens=args.tokens)
+    print(f"🤖 Stub Ollama listening on {stub.url} ({args.tokens_per_second} tok/s, {args.latency_ms} ms latency)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
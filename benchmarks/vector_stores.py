@@ -0,0 +1,120 @@
+# vector_stores.py
+"""
+Chroma (HNSW) vs. the in-memory NumPy engine (exact) from vector_store.py.
+
+For every engine it reports, on the stored finance_documents:
+  - single-query latency (p50 / p95), the /query workload
+  - batched-query throughput in queries/sec, the /query/batch workload
+  - filtered-query latency with a metadata pre-filter (--where)
+  - recall@k against the exact NumPy float32 results
+  - load time and matrix memory
+
+Queries are the app's questions plus a random sample of stored documents.
+
+Usage (from the project root):
+    python benchmarks/vector_stores.py --k 10 --batch-size 32 --output stores.json
+    python benchmarks/vector_stores.py --where '{"source": {"$in": ["Yahoo Finance"]}}'
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embeddings import load_embedding_model
+from settings import CHROMA_PATH, COLLECTION_NAME, prewarm_queries
+from vector_store import ChromaVectorStore, NumpyVectorStore
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def latency_stats(seconds):
+    values = np.asarray(seconds) * 1000
+    return {"p50_ms": round(float(np.percentile(values, 50)), 3),
+            "p95_ms": round(float(np.percentile(values, 95)), 3)}
+
+
+def recall(found_ids, truth_ids, k):
+    return round(float(np.mean([len(set(found) & set(truth)) / k for found, truth in zip(found_ids, truth_ids)])), 4)
+
+
+def bench_store(store, queries, k, batch_size, where, truth_ids):
+    include = ["documents", "metadatas", "distances"]
+    store.query(queries[:1], k, include=include)  # warm up
+
+    single, found = [], []
+    for query in queries:
+        result, elapsed = timed(store.query, [query], k, include=include)
+        single.append(elapsed)
+        found.append(result['ids'][0])
+
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+    batch_seconds = sum(timed(store.query, batch, k, include=include)[1] for batch in batches)
+
+    filtered = [timed(store.query, [query], k, where=where, include=include)[1] for query in queries] if where else []
+
+    stats = {
+        "single": latency_stats(single),
+        "batch_qps": round(len(queries) / batch_seconds, 1),
+        "recall": recall(found, truth_ids, k),
+    }
+    if filtered:
+        stats["filtered"] = latency_stats(filtered)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chroma-path", default=CHROMA_PATH)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--doc-queries", type=int, default=200, help="Stored documents sampled as extra queries")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--where", type=json.loads, help="Metadata filter (build_where format) for the filtered run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    chroma = ChromaVectorStore.open(args.chroma_path, args.collection)
+    stores = {"chroma": (chroma, 0.0, None)}
+    for dtype in ("float32", "float16"):
+        store, elapsed = timed(NumpyVectorStore.from_chroma, chroma, dtype=dtype)
+        stores[f"numpy-{dtype}"] = (store, elapsed, store.stats()["matrix_mb"])
+    exact = stores["numpy-float32"][0]
+    print(f"📁 {exact.count()} documents (space={exact.space})")
+
+    model = load_embedding_model()
+    questions = model.encode(prewarm_queries(), show_progress_bar=False, convert_to_numpy=True).astype(np.float32)
+    rng = np.random.default_rng(args.seed)
+    sampled = rng.choice(exact.count(), size=min(args.doc_queries, exact.count()), replace=False)
+    all_ids = exact.get(include=[])['ids']
+    stored = exact.get(ids=[all_ids[i] for i in sampled], include=["embeddings"])['embeddings']
+    queries = [vec.tolist() for vec in questions] + [np.asarray(vec).tolist() for vec in stored]
+    truth_ids = exact.query(queries, args.k, include=[])['ids']
+
+    results = {}
+    print(f"\n{'engine':<14} {'p50 ms':>8} {'p95 ms':>8} {'batch q/s':>10} {'recall':>7} "
+          f"{'filt p50':>9} {'load s':>7} {'matrix MB':>10}")
+    for name, (store, load_seconds, matrix_mb) in stores.items():
+        stats = bench_store(store, queries, args.k, args.batch_size, args.where, truth_ids)
+        stats.update({"load_s": round(load_seconds, 2), "matrix_mb": matrix_mb})
+        results[name] = stats
+        filtered = stats.get("filtered", {}).get("p50_ms", "-")
+        print(f"{name:<14} {stats['single']['p50_ms']:>8} {stats['single']['p95_ms']:>8} {stats['batch_qps']:>10} "
+              f"{stats['recall']:>7} {filtered:>9} {stats['load_s']:>7} {str(matrix_mb or '-'):>10}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"config": vars(args), "documents": exact.count(), "queries": len(queries),
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# bm25.py
+"""
+In-process BM25 keyword retriever over the finance_documents texts.
+
+MiniLM similarity is weak on exact tokens such as ticker symbols ("FCEL", "BRK-B")
+and company names; BM25 is strong on exactly those. The index is built from the
+Chroma collection, pickled next to it (<chroma_path>/bm25_index.pkl) and refreshed
+whenever the loader adds documents. Results are fused with the vector hits by
+reciprocal rank (see rrf_fuse).
+"""
+import math
+import os
+import pickle
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from filters import matches_where
+
+INDEX_FILE = "bm25_index.pkl"
+
+# Keeps tickers and symbols together: "BRK-B" -> "brk-b", "S&P" -> "s&p", "BTC-USD" -> "btc-usd"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-.&][a-z0-9]+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "what", "with", "about",
+    "any", "people", "saying", "think", "tell", "me", "how", "there",
+}
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Args:
+        k1: Term-frequency saturation
+        b: Document-length normalization
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.metadatas = []
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.postings = {}  # term -> (doc indices, term frequencies)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build(self, ids, texts, metadatas):
+        postings = defaultdict(lambda: ([], []))
+        doc_len = []
+        for doc_index, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term][0].append(doc_index)
+                postings[term][1].append(tf)
+
+        self.ids = list(ids)
+        self.metadatas = list(metadatas)
+        self.doc_len = np.asarray(doc_len, dtype=np.float32)
+        self.postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (docs, tfs) in postings.items()
+        }
+        return self
+
+    @classmethod
+    def from_collection(cls, collection, page_size=1000):
+        """Builds the index from every document in a Chroma collection or VectorStore (anything with count/get)."""
+        ids, texts, metadatas = [], [], []
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            ids.extend(page['ids'])
+            texts.extend(page['documents'])
+            metadatas.extend(page['metadatas'])
+        return cls().build(ids, texts, metadatas)
+
+    def search(self, query, n, where=None):
+        """Returns up to n (doc_id, score) pairs, best first; `where` is a build_where() clause."""
+        if not self.ids:
+            return []
+        num_docs = len(self.ids)
+        avg_len = float(self.doc_len.mean()) or 1.0
+        scores = np.zeros(num_docs, dtype=np.float32)
+
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            docs, tfs = self.postings[term]
+            idf = math.log(1 + (num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / avg_len)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+        candidates = np.nonzero(scores)[0]
+        if where:
+            candidates = [i for i in candidates if matches_where(self.metadatas[i], where)]
+        ranked = sorted(candidates, key=lambda i: scores[i], reverse=True)[:n]
+        return [(self.ids[i], float(scores[i])) for i in ranked]
+
+    def save(self, chroma_path):
+        with open(os.path.join(chroma_path, INDEX_FILE), 'wb') as f:
+            pickle.dump({
+                "k1": self.k1, "b": self.b, "ids": self.ids, "metadatas": self.metadatas,
+                "doc_len": self.doc_len, "postings": self.postings,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, chroma_path):
+        """Loads the persisted index, or returns None if there is none."""
+        path = os.path.join(chroma_path, INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        index = cls(k1=state["k1"], b=state["b"])
+        index.ids = state["ids"]
+        index.metadatas = state["metadatas"]
+        index.doc_len = state["doc_len"]
+        index.postings = state["postings"]
+        return index
+
+
+def rrf_fuse(ranked_lists, n, k=60):
+    """
+    Reciprocal rank fusion: score(doc) = sum over lists of 1 / (k + rank).
+
+    Args:
+        ranked_lists: Lists of doc ids, best first
+        n: Number of fused ids to return
+        k: Damping constant (60 is the value from the original RRF paper)
+    """
+    scores = defaultdict(float)
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:n]
@@ -0,0 +1,293 @@
+# caches.py
+"""
+In-memory caches used by the query path, and the on-disk embedding cache shared
+by the API and the loader.
+"""
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text):
+    """Cache key for a question: case-, whitespace- and trailing-punctuation-insensitive."""
+    text = " ".join(text.lower().split())
+    return re.sub(r"[\s?.!]+$", "", text)
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings keyed on normalized question text.
+
+    Args:
+        max_size: Maximum number of entries; the least recently used entry is evicted first
+        ttl_seconds: Optional lifetime of an entry; None keeps entries until evicted
+    """
+
+    def __init__(self, max_size=1024, ttl_seconds=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (stored_at, embedding)
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        key = normalize_query(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None:
+                if time.monotonic() - entry[0] > self.ttl_seconds:
+                    del self._entries[key]
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, text, embedding):
+        key = normalize_query(text)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SemanticAnswerCache:
+    """
+    Caches full answers and returns one when a new query embedding is within a
+    cosine-similarity threshold of a cached query for the same model.
+
+    Entries are evicted LRU-first and after ttl_seconds. Every entry is tagged with
+    the data version it was produced from; when the caller reports a different
+    version (the collection changed), the whole cache is dropped.
+
+    Args:
+        max_size: Maximum number of cached answers
+        threshold: Minimum cosine similarity (0-1) for a hit
+        ttl_seconds: Optional lifetime of an entry; None keeps entries until evicted
+    """
+
+    def __init__(self, max_size=256, threshold=0.9, ttl_seconds=3600):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.data_version = None
+        self._entries = OrderedDict()  # entry_id -> (stored_at, match_key, unit_vector, response)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _check_version(self, data_version):
+        if data_version != self.data_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.data_version = data_version
+
+    def lookup(self, embedding, match_key, data_version):
+        """Returns (response, similarity) for the closest cached query, or (None, best_similarity)."""
+        query = _unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(data_version)
+            if self.ttl_seconds is not None:
+                expired = [k for k, e in self._entries.items() if now - e[0] > self.ttl_seconds]
+                for k in expired:
+                    del self._entries[k]
+
+            candidates = [(k, e) for k, e in self._entries.items() if e[1] == match_key]
+            if not candidates:
+                self.misses += 1
+                return None, 0.0
+
+            matrix = np.stack([e[2] for _, e in candidates])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            best_similarity = float(similarities[best])
+            if best_similarity < self.threshold:
+                self.misses += 1
+                return None, best_similarity
+
+            entry_id, entry = candidates[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return entry[3], best_similarity
+
+    def store(self, embedding, match_key, data_version, response):
+        with self._lock:
+            if data_version != self.data_version:
+                # Answered from data that has been replaced while it was generated
+                return
+            self._entries[self._next_id] = (time.monotonic(), match_key, _unit(embedding), response)
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _unit(embedding):
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+
+class DiskEmbeddingCache:
+    """
+    Persistent embedding cache: a SQLite file keyed by (model id, SHA-256 of the
+    exact text), vectors stored as raw float32 bytes (~1.6 KB per 384-d entry).
+
+    Rebuilding chroma_db (new index settings, re-chunking) re-embeds the same
+    texts with the same model; with this cache the loader reads them back
+    instead. The API consults it for question cache misses. WAL mode lets the
+    API workers and a running loader share the file.
+
+    When more than max_entries are stored, the least recently used ones are
+    deleted down to 90% of the bound. Recency is refreshed at most once per
+    touch_interval seconds per entry, so hits rarely cost a write.
+
+    Args:
+        path: SQLite file (created if missing)
+        max_entries: Size bound of the cache
+        touch_interval: Seconds before a hit refreshes an entry's last-used time
+    """
+
+    def __init__(self, path, max_entries=200_000, touch_interval=3600.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text_hash BLOB NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._size = self._count()
+
+    @staticmethod
+    def text_key(text):
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def _count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, texts):
+        """One float32 vector (or None on a miss) per text, in order."""
+        keys = [self.text_key(text) for text in texts]
+        found, stale = {}, []
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), 500):  # stay below SQLite's bound-parameter limit
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector, last_used FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({','.join('?' * len(chunk))})",
+                    [model, *chunk],
+                )
+                for key, vector, last_used in rows:
+                    found[key] = vector
+                    if now - last_used > self.touch_interval:
+                        stale.append((now, model, key))
+            if stale:
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?", stale)
+            hits = sum(key in found for key in keys)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return [np.frombuffer(found[key], dtype=np.float32) if key in found else None for key in keys]
+
+    def put_many(self, model, texts, vectors):
+        now = time.time()
+        rows = [(model, self.text_key(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+                for text, vector in zip(texts, vectors)]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                cursor = self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._size += max(cursor.rowcount, 0)
+            if self._size > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        # Other processes write to the same file: count again before deciding how much to drop
+        self._size = self._count()
+        excess = self._size - int(self.max_entries * 0.9)
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE (model, text_hash) IN "
+            "(SELECT model, text_hash FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self.evictions += excess
+        self._size = self._count()
+
+    def __len__(self):
+        return self._size
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "path": self.path,
+        }
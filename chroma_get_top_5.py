@@ -1,6 +1,6 @@
 # chroma_test.py
-import chromadb
-from sentence_transformers import SentenceTransformer
+from embeddings import load_embedding_model
+from vector_store import open_vector_store
 
 def run_query():
     print("=" * 60)
@@ -9,13 +9,12 @@ def run_query():
 
     # 1. Initialize
     print("\n📊 Loading model...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    model = load_embedding_model()  # EMBEDDING_BACKEND=torch | onnx | onnx-int8
     
     print("📁 Connecting to database...")
-    client = chromadb.PersistentClient(path="./chroma_db")
-    collection = client.get_collection("finance_documents")
+    store = open_vector_store(chroma_path="./chroma_db")  # VECTOR_STORE=chroma | numpy | snapshot
     
-    print(f"✓ Connected! Total documents: {collection.count()}")
+    print(f"✓ Connected ({store.engine})! Total documents: {store.count()}")
     
     # 2. Define Query
     # You can change this text to search for anything
@@ -26,8 +25,8 @@ def run_query():
     query_embedding = model.encode(query_text).tolist()
     
     # 4. Search (Get top 5)
-    results = collection.query(
-        query_embeddings=[query_embedding],
+    results = store.query(
+        [query_embedding],
         n_results=5,  # Requesting top 5 results
         include=["documents", "metadatas", "distances"]
     )
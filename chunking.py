@@ -0,0 +1,129 @@
+# chunking.py
+"""
+Token-aware chunking of long documents, and collapsing chunk hits back to their parent.
+
+all-MiniLM-L6-v2 embeds at most 256 word-pieces and silently ignores the rest,
+so a long Reddit post used to be searchable by its first paragraph only while
+the whole post went to the LLM. The loader now splits every document into
+windows of at most CHUNK_MAX_TOKENS tokens (measured with the embedding model's
+own tokenizer) that overlap by CHUNK_OVERLAP_TOKENS, and stores each window as
+its own row:
+
+    id          <parent id> for the first chunk, <parent id>#<i> for the others
+    parent_id   the document id from the collector file
+    chunk_index / chunk_count
+    chunk_start / chunk_end   character offsets of the chunk in the parent text
+
+Short documents (headlines) stay a single chunk with their original id. At
+query time collapse_chunks() groups the hits by parent_id, so every document
+appears once in the sources, carrying only the chunks that matched.
+"""
+CHUNK_FIELDS = ("chunk_index", "chunk_count", "chunk_start", "chunk_end")
+# Bookkeeping of the loader (and the date_int filter field, see filters.py), not something to show next to a source
+INTERNAL_FIELDS = CHUNK_FIELDS + ("parent_id", "chunking", "content_hash", "date_int")
+GAP = " … "
+
+
+def chunk_spans(text, tokenizer, max_tokens=256, overlap=32):
+    """
+    Character spans (start, end) of overlapping windows of at most max_tokens tokens.
+
+    max_tokens includes the two special tokens ([CLS]/[SEP]) the encoder adds.
+    Windows are cut on token boundaries and widened to whole words.
+    """
+    window = max(1, max_tokens - 2)
+    step = max(1, window - overlap)
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    if len(offsets) <= window:
+        return [(0, len(text))]
+
+    spans = []
+    for first in range(0, len(offsets), step):
+        last = min(first + window, len(offsets)) - 1
+        start, end = offsets[first][0], offsets[last][1]
+        # A word split into several word-pieces stays whole
+        while start > 0 and not text[start - 1].isspace():
+            start -= 1
+        while end < len(text) and not text[end].isspace():
+            end += 1
+        spans.append((start, end))
+        if last == len(offsets) - 1:
+            break
+    spans[0] = (0, spans[0][1])
+    spans[-1] = (spans[-1][0], len(text))
+    return spans
+
+
+def chunk_id(parent_id, index):
+    return parent_id if index == 0 else f"{parent_id}#{index}"
+
+
+def chunk_document(doc_id, text, metadata, tokenizer, max_tokens=256, overlap=32):
+    """[(id, text, metadata)] for one document; metadata gets parent_id and the chunk fields."""
+    spans = chunk_spans(text, tokenizer, max_tokens, overlap)
+    return [
+        (chunk_id(doc_id, i), text[start:end], {
+            **metadata, "parent_id": doc_id, "chunk_index": i, "chunk_count": len(spans),
+            "chunk_start": start, "chunk_end": end,
+        })
+        for i, (start, end) in enumerate(spans)
+    ]
+
+
+def _merge(chunks):
+    """Joins a parent's matching chunks in document order, dropping the text adjacent chunks share."""
+    chunks = sorted(chunks, key=lambda chunk: chunk[1].get("chunk_start", 0))
+    text, end = "", None
+    for doc, meta in chunks:
+        start = meta.get("chunk_start")
+        if end is not None and start is not None and start <= end:
+            text += doc[end - start:]
+        else:
+            text += (GAP if text else "") + doc
+        if start is not None:
+            end = max(end or 0, meta.get("chunk_end", start + len(doc)))
+    return text
+
+
+def public_metadata(metadata):
+    return {key: value for key, value in (metadata or {}).items() if key not in INTERNAL_FIELDS}
+
+
+def collapse_chunks(results, n):
+    """
+    Groups a single-query result (collection.query shape) by parent document.
+
+    Parents keep the rank and distance of their best chunk; their text is the
+    matching chunks merged in document order, so the context builder and the
+    LLM only see the parts of a long post that matched. Hits without a
+    parent_id (documents loaded before chunking) are their own parent.
+    Returns at most n parents, in the same shape.
+    """
+    if not results['ids'] or not results['ids'][0]:
+        return results
+    groups = {}  # parent id -> [best distance, first chunk metadata, [(doc, meta)]]
+    for doc_id, doc, meta, dist in zip(results['ids'][0], results['documents'][0],
+                                       results['metadatas'][0], results['distances'][0]):
+        meta = meta or {}
+        parent = meta.get("parent_id", doc_id)
+        if parent not in groups:
+            if len(groups) == n:
+                continue
+            groups[parent] = [dist, meta, []]
+        group = groups[parent]
+        group[0] = min(group[0], dist)
+        group[2].append((doc, meta))
+
+    parents = list(groups)
+    metadatas = []
+    for parent in parents:
+        meta = {key: value for key, value in groups[parent][1].items() if key not in CHUNK_FIELDS}
+        if len(groups[parent][2]) > 1 or "chunk_count" in groups[parent][1]:
+            meta["matched_chunks"] = len(groups[parent][2])
+        metadatas.append(meta)
+    return {
+        "ids": [parents],
+        "documents": [[_merge(groups[parent][2]) for parent in parents]],
+        "metadatas": [metadatas],
+        "distances": [[groups[parent][0] for parent in parents]],
+    }
@@ -0,0 +1,145 @@
+# context_builder.py
+"""
+Turns retrieved hits into the context block sent to the LLM.
+
+Appending every hit verbatim bloats the prompt: Yahoo ticker feeds repeat the same
+headline under several tickers and Reddit posts run up to 2000 characters, which
+makes LLM prefill slow. The builder
+  1. drops low-relevance hits (distance gap to the best hit / absolute cutoff), i.e. an adaptive k,
+  2. collapses near-identical texts,
+  3. trims long documents to their most query-relevant sentences,
+  4. stops adding documents once the token budget is spent.
+
+extractive_answer() reuses the sentence ranking to answer without the LLM when
+generation is too slow or Ollama is down (see LLM_LATENCY_BUDGET).
+
+Token counts are estimates (~4 characters per token for Llama-family tokenizers);
+the exact prompt size is reported by Ollama as prompt_eval_count.
+"""
+import math
+import re
+
+from bm25 import tokenize
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+TICKER_PREFIX = re.compile(r"^[A-Z0-9.\-]{1,10}:\s+")
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / 4)
+
+
+def _fingerprint(text):
+    # "AAPL: Apple beats..." and "MSFT: Apple beats..." are the same story
+    return set(tokenize(TICKER_PREFIX.sub("", text)))
+
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def trim_to_relevant(text, question, max_tokens):
+    """Keeps the sentences sharing the most terms with the question (in original order) within max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    sentences = [s for s in SENTENCE_SPLIT.split(text) if s.strip()]
+    query_terms = set(tokenize(question))
+    ranked = sorted(range(len(sentences)),
+                    key=lambda i: (len(query_terms & set(tokenize(sentences[i]))), -i),
+                    reverse=True)
+
+    keep, used = set(), 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i])
+        if used + cost > max_tokens:
+            continue
+        keep.add(i)
+        used += cost
+    if not keep:
+        # A single run-on sentence longer than the cap: hard cut
+        return text[:max_tokens * 4]
+    return " ".join(sentences[i] for i in sorted(keep))
+
+
+def build_context(question, results, token_budget=1500, doc_max_tokens=300,
+                  dedupe_threshold=0.85, distance_gap=0.35, max_distance=None):
+    """
+    Args:
+        question: The user's question (used to pick relevant sentences)
+        results: Single-query result in collection.query shape
+        token_budget: Maximum estimated tokens for the whole context block
+        doc_max_tokens: Maximum estimated tokens per document
+        dedupe_threshold: Word-set Jaccard similarity above which two hits count as duplicates
+        distance_gap: Drop hits farther than best distance + gap (None/0 disables)
+        max_distance: Drop hits farther than this absolute distance (None disables)
+
+    Returns:
+        (selected, context_text, context_tokens) where selected is a list of
+        (document, metadata, distance) tuples for the hits that made it into the context
+    """
+    if not results['documents'] or not results['documents'][0]:
+        return [], "", 0
+
+    # Hits keep their retrieval order (which may be a hybrid fusion rank, not pure distance)
+    hits = list(zip(results['documents'][0], results['metadatas'][0], results['distances'][0]))
+    best = min(hit[2] for hit in hits)
+
+    selected, fingerprints = [], []
+    lines, used = [], 0
+    for doc, meta, dist in hits:
+        # The closest hit always survives the relevance cutoffs
+        if dist > best and distance_gap and dist > best + distance_gap:
+            continue
+        if dist > best and max_distance is not None and dist > max_distance:
+            continue
+
+        fingerprint = _fingerprint(doc)
+        if any(_similarity(fingerprint, seen) >= dedupe_threshold for seen in fingerprints):
+            continue
+
+        text = trim_to_relevant(doc, question, doc_max_tokens)
+        line = f"- {text}\n"
+        cost = estimate_tokens(line)
+        if selected and used + cost > token_budget:
+            continue
+
+        selected.append((doc, meta, dist))
+        fingerprints.append(fingerprint)
+        lines.append(line)
+        used += cost
+
+    return selected, "".join(lines), used
+
+
+def extractive_answer(question, documents, max_sentences=4, max_tokens=200):
+    """
+    Answer made of the retrieved sentences sharing the most terms with the question.
+
+    Sentences are ranked across the top documents (earlier documents win ties)
+    and near-duplicates are skipped. Returns "" when no document has any text.
+    """
+    query_terms = set(tokenize(question))
+    candidates = []  # (overlap, -doc rank, -sentence rank, sentence)
+    for doc_rank, doc in enumerate(documents):
+        sentences = [s.strip() for s in SENTENCE_SPLIT.split(TICKER_PREFIX.sub("", doc)) if s.strip()]
+        for sentence_rank, sentence in enumerate(sentences):
+            overlap = len(query_terms & set(tokenize(sentence)))
+            candidates.append((overlap, -doc_rank, -sentence_rank, sentence))
+    candidates.sort(reverse=True)
+
+    picked, fingerprints, used = [], [], 0
+    for _, _, _, sentence in candidates:
+        if len(picked) >= max_sentences:
+            break
+        cost = estimate_tokens(sentence)
+        if picked and used + cost > max_tokens:
+            continue
+        fingerprint = _fingerprint(sentence)
+        if any(_similarity(fingerprint, seen) >= 0.85 for seen in fingerprints):
+            continue
+        picked.append(sentence if cost <= max_tokens else sentence[:max_tokens * 4])
+        fingerprints.append(fingerprint)
+        used += cost
+    return " ".join(picked)
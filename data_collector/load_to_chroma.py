@@ -1,17 +1,66 @@
 # load_to_chroma.py
-import chromadb
-from sentence_transformers import SentenceTransformer
-import json
+"""
+Loads collected JSONL documents into the Chroma collection, incrementally.
+
+Every document carries a content_hash of its text and metadata. Before encoding,
+the ids of the file are looked up in the collection: unchanged documents are
+skipped without touching the embedding model, changed ones are re-embedded and
+upserted, new ones are added. Re-running over an unchanged file only reads it.
+Long documents are split into overlapping token windows (chunking.py) that
+the embedding model can see whole; each chunk stores its parent_id.
+
+Vectors are also kept in the on-disk embedding cache (caches.DiskEmbeddingCache),
+so rebuilding chroma_db from scratch reads them back instead of re-encoding.
+
+Parsing, encoding and writing run as a pipeline (ingestion.py): the file is
+streamed in batches and Chroma writes overlap with encoding the next batch.
+
+Usage (from data_collector/):
+    python load_to_chroma.py --file yahoo_finance_data.jsonl --chroma-path ../chroma_db
+    python load_to_chroma.py --backfill-metadata --chroma-path ../chroma_db   # add date_int to an old database
+"""
+import os
+import sys
+import argparse
 from tqdm import tqdm
 import time
 
-def load_jsonl_to_chroma(jsonl_file, chroma_path='./chroma_db'):
+# Shared modules (settings, embeddings) live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bm25 import BM25Index
+from caches import DiskEmbeddingCache
+from chunking import chunk_document, chunk_id
+from embeddings import BulkEncoder, embedding_model_id, load_embedding_model, load_tokenizer
+from filters import with_derived_metadata
+from ingestion import format_progress, read_jsonl_batches, run_pipeline, stored_versions
+from settings import (
+    CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, EMBEDDING_DISK_CACHE_MAX_ENTRIES, INGEST_BATCH_SIZE, INGEST_ENCODE_BATCH_SIZE, INGEST_ENCODE_WORKERS,
+    VECTOR_SNAPSHOT_DTYPE, VECTOR_STORE, embedding_disk_cache_path, hnsw_metadata,
+)
+from snapshot import export_snapshot, read_manifest
+from vector_store import ChromaVectorStore, open_vector_store
+
+def load_jsonl_to_chroma(jsonl_file, chroma_path='./chroma_db', backend=None, snapshot_dir=None,
+                         batch_size=INGEST_BATCH_SIZE, queue_size=4, workers=INGEST_ENCODE_WORKERS,
+                         embedding_cache_path=None, chunk_max_tokens=CHUNK_MAX_TOKENS,
+                         chunk_overlap=CHUNK_OVERLAP_TOKENS):
     """
     Load your Reddit JSONL data into Chroma vector database
     
     Args:
         jsonl_file: Your collected data file (reddit_data.jsonl)
         chroma_path: Where to save Chroma database (./chroma_db)
+        backend: Embedding backend - torch, onnx or onnx-int8 (default: EMBEDDING_BACKEND setting)
+        snapshot_dir: Memory-mapped export for VECTOR_STORE=snapshot (default: <chroma_path>/snapshot)
+        batch_size: Documents per pipeline batch; each batch is length-sorted before encoding
+        queue_size: Batches buffered between two pipeline stages (bounds memory)
+        workers: Embedding processes (1 encodes in this process)
+        embedding_cache_path: On-disk embedding cache (default: next to chroma_path; "" disables it)
+        chunk_max_tokens: Tokens per chunk including special tokens (0 stores every document whole)
+        chunk_overlap: Tokens shared by consecutive chunks
+
+    Returns:
+        {"added", "updated", "skipped", "failed", "cache_hits"} document counts, or None if the file could not be read
     """
     
     print("=" * 60)
@@ -20,124 +69,197 @@ def load_jsonl_to_chroma(jsonl_file, chroma_path='./chroma_db'):
     print()
     
     # ============================================
-    # STEP 1: Initialize Embedding Model
-    # ============================================
-    print("📊 Loading embedding model (this may take a minute)...")
-    print("   Model: all-MiniLM-L6-v2 (384 dimensions)")
-    
-    # This model converts text to vectors (embeddings)
-    # IMPORTANT: Use the same model for both loading and querying!
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    print("✓ Embedding model loaded!\n")
-    
-    # ============================================
-    # STEP 2: Initialize Chroma with Persistent Storage
+    # STEP 1: Initialize Chroma with Persistent Storage
     # ============================================
     print(f"📁 Setting up Chroma database at: {chroma_path}")
     
-    # PersistentClient saves everything to disk
-    chroma_client = chromadb.PersistentClient(path=chroma_path)
-    
+    # PersistentClient saves everything to disk; writes always go to Chroma,
+    # the store of record (the NumPy engine is loaded from it)
     # Create or get collection
     # If collection exists, it will be retrieved; if not, created
-    collection = chroma_client.get_or_create_collection(
+    # HNSW settings (HNSW_M / HNSW_CONSTRUCTION_EF / HNSW_SEARCH_EF, picked with
+    # benchmarks/hnsw_sweep.py) only take effect when the collection is created
+    index_settings = hnsw_metadata()
+    store = ChromaVectorStore.open(
+        chroma_path,
         name="finance_documents",
-        metadata={"description": "Financial data from Reddit and other sources"}
+        create=True,
+        metadata={"description": "Financial data from Reddit and other sources", **index_settings}
     )
+    current_settings = {key: store.metadata.get(key) for key in index_settings}
+    print(f"   HNSW index settings: {current_settings}")
+    if current_settings != index_settings:
+        print(f"   ⚠️  Collection was created with different HNSW settings than configured {index_settings}")
+        print("      Delete the chroma_db folder and reload to apply them.")
     
-    # Check if data already exists
-    existing_count = collection.count()
+    existing_count = store.count()
     print(f"   Existing documents in database: {existing_count}")
-    
-    if existing_count > 0:
-        print(f"\n⚠️  WARNING: Database already has {existing_count} documents")
-        response = input("   Do you want to ADD more data? (yes/no): ")
-        if response.lower() != 'yes':
-            print("   Exiting without changes.")
-            return
-    
     print()
     
-    # ============================================
-    # STEP 3: Read JSONL File
-    # ============================================
-    print(f"📖 Reading data from: {jsonl_file}")
-    
-    texts = []
-    metadatas = []
-    ids = []
-    
-    try:
-        with open(jsonl_file, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                try:
-                    entry = json.loads(line)
-                    
-                    # Extract required fields
-                    texts.append(entry['text'])
-                    metadatas.append(entry['metadata'])
-                    ids.append(entry['id'])
-                    
-                except json.JSONDecodeError as e:
-                    print(f"   ⚠️  Skipping line {line_num}: Invalid JSON")
-                    continue
-                except KeyError as e:
-                    print(f"   ⚠️  Skipping line {line_num}: Missing field {e}")
-                    continue
-        
-        print(f"✓ Successfully read {len(texts)} entries from file\n")
-        
-    except FileNotFoundError:
+    if not os.path.exists(jsonl_file):
         print(f"❌ ERROR: File '{jsonl_file}' not found!")
         print("   Make sure you ran the Reddit collection script first.")
-        return
-    
-    if len(texts) == 0:
-        print("❌ ERROR: No valid entries found in file!")
-        return
-    
+        return None
+
     # ============================================
-    # STEP 4: Generate Embeddings and Load to Chroma
+    # STEP 2: Stream the File through Parse -> Chunk -> Encode -> Write
     # ============================================
-    print("🔄 Generating embeddings and loading into Chroma...")
-    print(f"   This will take ~{len(texts) * 0.1:.0f} seconds")
-    print()
-    
-    # Process in batches for memory efficiency
-    batch_size = 100
-    total_added = 0
-    
-    for i in tqdm(range(0, len(texts), batch_size), desc="Processing batches"):
-        # Get batch
-        batch_texts = texts[i:i+batch_size]
-        batch_metadatas = metadatas[i:i+batch_size]
-        batch_ids = ids[i:i+batch_size]
-        
-        try:
-            # Generate embeddings for this batch
+    # parse:  read a batch of lines, drop documents whose content_hash is already stored
+    # chunk:  split long documents into overlapping windows the model sees whole
+    # encode: embed the remaining texts, length-bucketed and spread over `workers`
+    #         processes (the model is only loaded if something is left)
+    # write:  upsert into Chroma while the next batch is being encoded
+    print(f"🔄 Streaming {jsonl_file} into Chroma (batches of {batch_size})...")
+    counts = {"added": 0, "updated": 0, "skipped": 0, "failed": 0, "cache_hits": 0, "chunks": 0}
+    seen = {}  # id -> content_hash of every document read so far (repeated ids within the file)
+    chunk_counts = {}  # id -> chunks written for it in this run (only touched by the chunk stage)
+    source_counts, sub_counts = {}, {}
+    encoder = tokenizer = None
+
+    # Texts embedded by any earlier run (or by the API) with the same model are read back, not re-encoded
+    if embedding_cache_path is None:
+        embedding_cache_path = embedding_disk_cache_path(chroma_path)
+    cache = None
+    if embedding_cache_path and EMBEDDING_DISK_CACHE_MAX_ENTRIES:
+        cache = DiskEmbeddingCache(embedding_cache_path, max_entries=EMBEDDING_DISK_CACHE_MAX_ENTRIES)
+        print(f"   Embedding cache: {len(cache)} vectors at {embedding_cache_path}")
+    model_id = embedding_model_id(backend)
+
+    def prepare_metadata(metadata):
+        metadata = with_derived_metadata(metadata)
+        if chunk_max_tokens:
+            # Part of the content hash: new chunk settings re-chunk every document
+            metadata['chunking'] = f"{chunk_max_tokens}/{chunk_overlap}"
+        return metadata
+
+    def parse():
+        for batch in read_jsonl_batches(jsonl_file, batch_size, prepare_metadata=prepare_metadata):
+            lookup = [doc_id for doc_id in batch["ids"] if doc_id not in seen]
+            stored = stored_versions(store, lookup) if existing_count and lookup else {}
+            known = {doc_id: content for doc_id, (content, _) in stored.items()}
+            known.update((doc_id, seen[doc_id]) for doc_id in batch["ids"] if doc_id in seen)
+
+            todo = {"ids": [], "texts": [], "metadatas": [], "updated": 0,
+                    "previous_chunks": {doc_id: chunks for doc_id, (_, chunks) in stored.items()}}
+            for doc_id, text, metadata in zip(batch["ids"], batch["texts"], batch["metadatas"]):
+                # Breakdowns count every document in the file, written or not
+                source = metadata.get('source', 'Unknown')
+                source_counts[source] = source_counts.get(source, 0) + 1
+                if 'subreddit' in metadata:
+                    sub_counts[metadata['subreddit']] = sub_counts.get(metadata['subreddit'], 0) + 1
+
+                seen[doc_id] = metadata['content_hash']
+                if known.get(doc_id) == metadata['content_hash']:
+                    counts["skipped"] += 1
+                    continue
+                if doc_id in todo["ids"]:
+                    # Same id twice in one batch: the later version replaces the earlier one
+                    row = todo["ids"].index(doc_id)
+                    todo["texts"][row], todo["metadatas"][row] = text, metadata
+                    continue
+                todo["updated"] += doc_id in known
+                todo["ids"].append(doc_id)
+                todo["texts"].append(text)
+                todo["metadatas"].append(metadata)
+                known[doc_id] = metadata['content_hash']
+            if todo["ids"]:
+                yield todo
+
+    def chunk(batch):
+        nonlocal tokenizer
+        if tokenizer is None:
+            tokenizer = load_tokenizer()
+        chunked = {"ids": [], "texts": [], "metadatas": [], "updated": batch["updated"],
+                   "documents": len(batch["ids"]), "stale_ids": []}
+        for doc_id, text, metadata in zip(batch["ids"], batch["texts"], batch["metadatas"]):
+            chunks = chunk_document(doc_id, text, metadata, tokenizer, chunk_max_tokens, chunk_overlap)
+            # A changed document that now has fewer chunks leaves its old tail behind otherwise
+            previous = max(chunk_counts.get(doc_id, 0), batch["previous_chunks"].get(doc_id, 0))
+            chunked["stale_ids"].extend(chunk_id(doc_id, i) for i in range(len(chunks), previous))
+            chunk_counts[doc_id] = len(chunks)
+            for row_id, row_text, row_metadata in chunks:
+                chunked["ids"].append(row_id)
+                chunked["texts"].append(row_text)
+                chunked["metadatas"].append(row_metadata)
+        return chunked
+
+    def encode(batch):
+        # This model converts text to vectors (embeddings)
+        # IMPORTANT: Use the same model for both loading and querying!
+        nonlocal encoder
+        texts = batch["texts"]
+        vectors = cache.get_many(model_id, texts) if cache is not None else [None] * len(texts)
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        counts["cache_hits"] += len(texts) - len(missing)
+        if missing:
+            if encoder is None:
+                print(f"📊 Loading embedding model on {workers} process(es) (this may take a minute)...")
+                encoder = BulkEncoder(load_embedding_model(backend), workers=workers,
+                                      batch_size=INGEST_ENCODE_BATCH_SIZE)
+                print("✓ Embedding model loaded!")
             # This is where the "magic" happens - text becomes vectors!
-            batch_embeddings = model.encode(
-                batch_texts,
-                show_progress_bar=False,
-                convert_to_numpy=True
-            ).tolist()
-            
-            # Add to Chroma (automatically saves to disk!)
-            collection.add(
-                documents=batch_texts,        # Original text
-                embeddings=batch_embeddings,  # Vector representations
-                metadatas=batch_metadatas,    # Metadata (source, date, etc.)
-                ids=batch_ids                 # Unique IDs
-            )
-            
-            total_added += len(batch_texts)
-            
-        except Exception as e:
-            print(f"\n⚠️  Error processing batch {i//batch_size + 1}: {e}")
-            continue
-    
+            encoded = encoder.encode([texts[i] for i in missing])
+            if cache is not None:
+                cache.put_many(model_id, [texts[i] for i in missing], encoded)
+            for i, vec in zip(missing, encoded):
+                vectors[i] = vec
+        batch["embeddings"] = [vec.tolist() for vec in vectors]
+        return batch
+
+    def write(batch):
+        if batch.get("stale_ids"):
+            store.delete(batch["stale_ids"])
+        # Upsert: new ids are added, changed ones overwritten (automatically saves to disk!)
+        store.upsert(
+            documents=batch["texts"],           # Original text
+            embeddings=batch["embeddings"],     # Vector representations
+            metadatas=batch["metadatas"],       # Metadata (source, date, content_hash, etc.)
+            ids=batch["ids"]                    # Stable, content-addressed IDs (one per chunk)
+        )
+        counts["updated"] += batch["updated"]
+        counts["added"] += batch.get("documents", len(batch["ids"])) - batch["updated"]
+        counts["chunks"] += len(batch["ids"])
+        return batch
+
+    try:
+        stages = [("chunk", chunk)] if chunk_max_tokens else []
+        stages += [("encode", encode), ("write", write)]
+        stage_stats = run_pipeline(parse(), stages, queue_size=queue_size)
+    except RuntimeError as e:
+        print(f"❌ ERROR: {e}")
+        return None
+    finally:
+        if encoder is not None:
+            encoder.close()
+        if cache is not None:
+            cache.close()
+    # Every stage counts documents (see ingestion._batch_size), however many chunks they became
+    counts["failed"] = sum(stats.failed for stats in stage_stats.values())
+    added, updated, skipped, failed = counts["added"], counts["updated"], counts["skipped"], counts["failed"]
+
+    print(f"\n⏱️  Pipeline: {format_progress(stage_stats)}")
+    print(f"   {'stage':<8} {'docs':>7} {'docs/s busy':>12} {'busy s':>8} {'utilization':>12}")
+    for name, stats in stage_stats.items():
+        row = stats.as_dict()
+        print(f"   {name:<8} {row['documents']:>7} {row['docs_per_s']:>12} {row['busy_s']:>8} {row['utilization']:>12.0%}")
     print()
+
+    # Keep the keyword (BM25) index used by hybrid retrieval in sync with the collection
+    keyword_index = BM25Index.load(chroma_path)
+    if added or updated or keyword_index is None or len(keyword_index) != store.count():
+        print("🔤 Rebuilding keyword index...")
+        keyword_index = BM25Index.from_collection(store)
+        keyword_index.save(chroma_path)
+        print(f"✓ Keyword index saved ({len(keyword_index)} documents)\n")
+
+    # Re-export the memory-mapped snapshot served with VECTOR_STORE=snapshot
+    snapshot_dir = snapshot_dir or os.path.join(chroma_path, "snapshot")
+    manifest = read_manifest(snapshot_dir)
+    snapshot_stale = manifest is None or added or updated or manifest["count"] != store.count()
+    if (VECTOR_STORE == "snapshot" or manifest is not None) and snapshot_stale:
+        print("📦 Exporting embedding snapshot...")
+        manifest = export_snapshot(store, snapshot_dir, dtype=VECTOR_SNAPSHOT_DTYPE)
+        print(f"✓ Snapshot saved ({manifest['count']} documents, {manifest['dtype']}) at {snapshot_dir}\n")
     
     # ============================================
     # STEP 5: Verify Results
@@ -146,31 +268,27 @@ def load_jsonl_to_chroma(jsonl_file, chroma_path='./chroma_db'):
     print("✅ LOADING COMPLETE!")
     print("=" * 60)
     
-    final_count = collection.count()
+    final_count = store.count()
     
     print(f"\n📊 Database Statistics:")
     print(f"   Total documents: {final_count}")
-    print(f"   Newly added: {total_added}")
+    print(f"   Added: {added}")
+    print(f"   Updated: {updated}")
+    print(f"   Skipped (unchanged): {skipped}")
+    print(f"   Chunks written: {counts['chunks']}")
+    print(f"   Embeddings read from cache: {counts['cache_hits']}")
+    if failed:
+        print(f"   Failed: {failed}")
     print(f"   Database location: {chroma_path}/")
     
     # Show breakdown by source
     print(f"\n📈 Breakdown by source:")
-    source_counts = {}
-    for metadata in metadatas:
-        source = metadata.get('source', 'Unknown')
-        source_counts[source] = source_counts.get(source, 0) + 1
-    
     for source, count in sorted(source_counts.items()):
         print(f"   {source}: {count} documents")
     
     # Show breakdown by subreddit (if applicable)
-    if metadatas and 'subreddit' in metadatas[0]:
+    if sub_counts:
         print(f"\n📈 Breakdown by subreddit:")
-        sub_counts = {}
-        for metadata in metadatas:
-            sub = metadata.get('subreddit', 'Unknown')
-            sub_counts[sub] = sub_counts.get(sub, 0) + 1
-        
         for sub, count in sorted(sub_counts.items(), key=lambda x: x[1], reverse=True):
             print(f"   r/{sub}: {count} documents")
     
@@ -178,6 +296,36 @@ def load_jsonl_to_chroma(jsonl_file, chroma_path='./chroma_db'):
     print(f"   Location: {chroma_path}/")
     print(f"   You can now use this with your RAG system.")
     print("=" * 60)
+    return {"added": added, "updated": updated, "skipped": skipped, "failed": failed, "cache_hits": counts["cache_hits"],
+            "stages": {name: stats.as_dict() for name, stats in stage_stats.items()}}
+
+# ============================================
+# Backfill Derived Metadata (for databases loaded before date_int existed)
+# ============================================
+
+def backfill_derived_metadata(chroma_path='./chroma_db', batch_size=500):
+    """
+    Adds date_int (and any other derived filter fields) to documents already in Chroma,
+    without re-embedding them
+    """
+    collection = ChromaVectorStore.open(chroma_path, "finance_documents").collection
+    total = collection.count()
+    updated = 0
+
+    print(f"🔧 Backfilling filter metadata for {total} documents...")
+    for offset in tqdm(range(0, total, batch_size), desc="Updating batches"):
+        batch = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        changed_ids, changed_metadatas = [], []
+        for doc_id, metadata in zip(batch['ids'], batch['metadatas']):
+            derived = with_derived_metadata(metadata)
+            if derived != metadata:
+                changed_ids.append(doc_id)
+                changed_metadatas.append(derived)
+        if changed_ids:
+            collection.update(ids=changed_ids, metadatas=changed_metadatas)
+            updated += len(changed_ids)
+
+    print(f"✓ Updated {updated} documents")
 
 # ============================================
 # Test Query Function (Optional)
@@ -194,13 +342,12 @@ def test_chroma_database(chroma_path='./chroma_db'):
     
     # Load model and database
     print("📊 Loading embedding model...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    model = load_embedding_model()
     
     print("📁 Connecting to Chroma database...")
-    chroma_client = chromadb.PersistentClient(path=chroma_path)
-    collection = chroma_client.get_collection("finance_documents")
+    store = open_vector_store(chroma_path=chroma_path, name="finance_documents")
     
-    print(f"✓ Database loaded: {collection.count()} documents\n")
+    print(f"✓ Database loaded ({store.engine}): {store.count()} documents\n")
     
     # Test queries
     test_queries = [
@@ -216,8 +363,8 @@ def test_chroma_database(chroma_path='./chroma_db'):
         query_embedding = model.encode(query).tolist()
         
         # Search Chroma
-        results = collection.query(
-            query_embeddings=[query_embedding],
+        results = store.query(
+            [query_embedding],
             n_results=2,  # Top 2 results
             include=["documents", "metadatas", "distances"]
         )
@@ -245,19 +392,44 @@ def test_chroma_database(chroma_path='./chroma_db'):
 
 def main():
     """
-    Main function - loads data and optionally tests it
+    Main function - loads data and optionally tests it (no prompts, safe to run from cron)
     """
-    # Load your Reddit data into Chroma
-    load_jsonl_to_chroma(
-        jsonl_file='yahoo_finance_data.jsonl',  # Your collected data
-        chroma_path='./chroma_db'        # Where to save database
-    )
-    
-    # Optional: Test the database
-    print()
-    response = input("Would you like to test the database with sample queries? (yes/no): ")
-    if response.lower() == 'yes':
-        test_chroma_database('./chroma_db')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default="yahoo_finance_data.jsonl", help="Collected JSONL data")
+    parser.add_argument("--chroma-path", default="./chroma_db", help="Where to save the database")
+    parser.add_argument("--backend", default=None, help="torch, onnx or onnx-int8 (default: EMBEDDING_BACKEND)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE,
+                        help="Documents per pipeline batch (the length-bucketing window)")
+    parser.add_argument("--workers", type=int, default=INGEST_ENCODE_WORKERS, help="Embedding processes")
+    parser.add_argument("--embedding-cache", default=None,
+                        help="On-disk embedding cache file (default: next to the chroma folder; '' disables)")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_MAX_TOKENS,
+                        help="Tokens per chunk incl. special tokens (0 disables chunking)")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP_TOKENS)
+    parser.add_argument("--queue-size", type=int, default=4, help="Batches buffered between pipeline stages")
+    parser.add_argument("--test", action="store_true", help="Run sample queries against the database afterwards")
+    parser.add_argument("--backfill-metadata", action="store_true",
+                        help="Only add derived filter fields (date_int) to documents already in --chroma-path")
+    args = parser.parse_args()
+
+    if args.backfill_metadata:
+        backfill_derived_metadata(args.chroma_path)
+        return
+
+    started = time.perf_counter()
+    summary = load_jsonl_to_chroma(args.file, chroma_path=args.chroma_path, backend=args.backend,
+                                   batch_size=args.batch_size, queue_size=args.queue_size, workers=args.workers,
+                                   embedding_cache_path=args.embedding_cache, chunk_max_tokens=args.chunk_tokens,
+                                   chunk_overlap=args.chunk_overlap)
+    if summary is None:
+        sys.exit(1)
+    print(f"\nadded={summary['added']} updated={summary['updated']} skipped={summary['skipped']} "
+          f"failed={summary['failed']} cache_hits={summary['cache_hits']} in {time.perf_counter() - started:.1f}s")
+
+    if args.test:
+        test_chroma_database(args.chroma_path)
+    if summary['failed']:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -50,7 +50,7 @@ def collect_reddit_no_auth():
     
     # Quality filters
     MIN_TEXT_LENGTH = 100    # Minimum character count
-    MAX_TEXT_LENGTH = 2000   # Maximum to keep manageable
+    MAX_TEXT_LENGTH = 20000  # Maximum kept (the loader chunks long posts)
     MIN_SCORE = 5            # Minimum upvotes
     
     # ============================================
@@ -1,5 +1,6 @@
 # collect_yahoo_working.py
 import feedparser
+import hashlib
 import json
 from datetime import datetime
 import time
@@ -17,6 +18,10 @@ def clean_html(text):
     text = ' '.join(text.split())
     return text
 
+def stable_id(text):
+    """Same input, same id in every run (unlike hash(), which is salted per process)"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
 def collect_yahoo_finance():
     """
     Collect Yahoo Finance news using WORKING RSS feeds
@@ -76,8 +81,8 @@ def collect_yahoo_finance():
                     if len(text) < 50:
                         continue
                     
-                    if len(text) > 2000:
-                        text = text[:2000]
+                    if len(text) > 20000:  # the loader chunks long texts
+                        text = text[:20000]
                     
                     url = entry.get('link', '')
                     
@@ -88,7 +93,7 @@ def collect_yahoo_finance():
                         date = datetime.now().strftime('%Y-%m-%d')
                     
                     entry_data = {
-                        'id': f"yahoo_{feed_name.replace(' ', '_')}_{hash(title)}",
+                        'id': f"yahoo_{feed_name.replace(' ', '_')}_{stable_id(url or title)}",
                         'text': text,
                         'metadata': {
                             'source': 'Yahoo Finance',
@@ -225,8 +230,8 @@ def collect_yahoo_finance():
                     if len(text) < 50:
                         continue
                     
-                    if len(text) > 2000:
-                        text = text[:2000]
+                    if len(text) > 20000:  # the loader chunks long texts
+                        text = text[:20000]
                     
                     url = entry.get('link', '')
                     
@@ -236,7 +241,7 @@ def collect_yahoo_finance():
                         date = datetime.now().strftime('%Y-%m-%d')
                     
                     entry_data = {
-                        'id': f"yahoo_ticker_{ticker}_{hash(title)}",
+                        'id': f"yahoo_ticker_{ticker}_{stable_id(url or title)}",
                         'text': text,
                         'metadata': {
                             'source': 'Yahoo Finance',
@@ -0,0 +1,176 @@
+# embedding_server.py
+"""
+Embedding sidecar: one process holds the SentenceTransformer, every API worker
+asks it for vectors over a Unix socket (EMBEDDING_SHARING=sidecar).
+
+Without it each uvicorn worker loads its own model and torch runtime, so memory
+grows linearly with API_WORKERS. The sidecar micro-batches the texts of all
+workers together (the same EmbeddingBatcher the API uses), so concurrent
+requests from different workers still share one encode() call.
+
+Wire format, one request/response pair at a time per connection:
+    request:  4-byte big-endian length + JSON {"texts": [...]}
+    response: 4-byte big-endian length + JSON {"shape": [n, dim]} (or {"error": "..."}),
+              followed by n * dim little-endian float32 values
+
+`python main.py` starts the sidecar itself in sidecar mode; to run it on its own:
+    python embedding_server.py --socket /tmp/finance-rag-embeddings.sock
+"""
+import os
+import json
+import time
+import socket
+import struct
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from settings import EMBEDDING_BACKEND, EMBEDDING_SOCKET, ENCODE_BATCH_MAX_SIZE, ENCODE_BATCH_WINDOW_MS, ENCODE_WORKERS
+
+HEADER = struct.Struct(">I")
+
+
+def _pack(header, payload=b""):
+    data = json.dumps(header).encode()
+    return HEADER.pack(len(data)) + data + payload
+
+
+class EmbeddingClient:
+    """
+    Drop-in for SentenceTransformer.encode() backed by the sidecar.
+
+    Each thread keeps its own connection, so the encode executor threads of a
+    worker can call it concurrently.
+    """
+
+    def __init__(self, socket_path=EMBEDDING_SOCKET, timeout=30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+            self._local.conn = conn
+        return conn
+
+    def _close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _read_exactly(conn, size):
+        chunks, remaining = [], size
+        while remaining:
+            chunk = conn.recv(remaining)
+            if not chunk:
+                raise ConnectionError("Embedding sidecar closed the connection")
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
+
+    def _request(self, texts):
+        conn = self._connection()
+        conn.sendall(_pack({"texts": texts}))
+        (length,) = HEADER.unpack(self._read_exactly(conn, HEADER.size))
+        header = json.loads(self._read_exactly(conn, length))
+        if "error" in header:
+            raise RuntimeError(f"Embedding sidecar: {header['error']}")
+        rows, dim = header["shape"]
+        payload = self._read_exactly(conn, rows * dim * 4)
+        return np.frombuffer(payload, dtype="<f4").reshape(rows, dim)
+
+    def encode(self, sentences, show_progress_bar=False, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        try:
+            vectors = self._request(texts)
+        except (ConnectionError, OSError):
+            # Sidecar restarted or the connection went stale: reconnect once
+            self._close()
+            vectors = self._request(texts)
+        if normalize_embeddings:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+    def wait_until_ready(self, timeout=120.0):
+        """Blocks until the sidecar answers (it may still be loading the model)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.encode(["ready?"])
+            except (ConnectionError, OSError):
+                self._close()
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+
+async def serve(socket_path, backend=None):
+    from batching import EmbeddingBatcher
+    from embeddings import load_embedding_model
+
+    print(f"📊 Loading embedding model ({backend or EMBEDDING_BACKEND})...")
+    model = load_embedding_model(backend)
+    model.encode(["warm up"], show_progress_bar=False)
+    executor = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="encode")
+    batcher = EmbeddingBatcher(
+        lambda texts: model.encode(texts, show_progress_bar=False),
+        executor,
+        max_batch_size=ENCODE_BATCH_MAX_SIZE,
+        max_wait_ms=ENCODE_BATCH_WINDOW_MS,
+    )
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+                except asyncio.IncompleteReadError:
+                    break
+                request = json.loads(await reader.readexactly(length))
+                try:
+                    vectors = await asyncio.gather(*(batcher.encode(text) for text in request["texts"]))
+                    matrix = np.asarray(vectors, dtype="<f4").reshape(len(vectors), -1 if vectors else 0)
+                    writer.write(_pack({"shape": list(matrix.shape)}, matrix.tobytes()))
+                except Exception as e:
+                    writer.write(_pack({"error": f"{type(e).__name__}: {e}"}))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    print(f"✓ Embedding sidecar listening on {socket_path}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.close()
+        executor.shutdown(wait=False)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=EMBEDDING_SOCKET)
+    parser.add_argument("--backend", default=None, help="torch, onnx or onnx-int8 (default: EMBEDDING_BACKEND)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.socket, args.backend))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
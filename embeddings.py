@@ -0,0 +1,165 @@
+# embeddings.py
+"""
+Pluggable embedding backends for all-MiniLM-L6-v2.
+
+    torch      - the original PyTorch SentenceTransformer
+    onnx       - the same weights exported to ONNX, run with onnxruntime
+    onnx-int8  - dynamically int8-quantized ONNX export (fastest on CPU)
+
+Every backend returns a SentenceTransformer, so callers keep using .encode().
+The ONNX backends need `pip install "sentence-transformers[onnx]"` (>= 3.2).
+Use the same backend family for loading and querying; see
+benchmarks/embedding_backends.py for the cosine drift between them.
+
+sentence_transformers (and torch) are imported only when a model is loaded, so
+API workers that use the embedding sidecar (EMBEDDING_SHARING=sidecar) never pay for them.
+
+BulkEncoder is the ingest-side encoder: length-bucketed batches, optionally
+spread over a pool of worker processes.
+"""
+import os
+
+import numpy as np
+
+from settings import (
+    EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_INT8_FILE, EMBEDDING_SHARING, EMBEDDING_SOCKET,
+)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def load_embedding_model(backend=None, model_name=None):
+    """
+    Args:
+        backend: One of BACKENDS (defaults to the EMBEDDING_BACKEND setting)
+        model_name: Hub id or local path (defaults to the EMBEDDING_MODEL_NAME setting)
+    """
+    from sentence_transformers import SentenceTransformer
+
+    backend = backend or EMBEDDING_BACKEND
+    model_name = model_name or EMBEDDING_MODEL_NAME
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+    if backend == "onnx-int8":
+        if not has_onnx_file(model_name, EMBEDDING_ONNX_INT8_FILE):
+            export_int8_model(model_name)
+        return SentenceTransformer(
+            model_name,
+            backend="onnx",
+            model_kwargs={"file_name": EMBEDDING_ONNX_INT8_FILE},
+        )
+    raise ValueError(f"Unknown embedding backend '{backend}' (expected one of {BACKENDS})")
+
+
+def load_tokenizer(model_name=None):
+    """The embedding model's tokenizer alone (chunking needs token counts, not the model)."""
+    from transformers import AutoTokenizer
+
+    model_name = model_name or EMBEDDING_MODEL_NAME
+    if not os.path.isdir(model_name) and "/" not in model_name:
+        # Short names like all-MiniLM-L6-v2 live under the sentence-transformers org on the hub
+        model_name = f"sentence-transformers/{model_name}"
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def embedding_model_id(backend=None, model_name=None):
+    """Identifies the vectors a model/backend produces; the on-disk embedding cache is keyed by it."""
+    backend = backend or EMBEDDING_BACKEND
+    model_name = model_name or EMBEDDING_MODEL_NAME
+    if backend == "onnx-int8":
+        return f"{model_name}|{backend}|{EMBEDDING_ONNX_INT8_FILE}"
+    return f"{model_name}|{backend}"
+
+
+def load_query_encoder(sharing=None):
+    """
+    The encoder the API uses for questions, per EMBEDDING_SHARING:
+        none / preload - a SentenceTransformer in this process
+        sidecar        - an EmbeddingClient talking to embedding_server.py (waits for it to come up)
+    """
+    sharing = sharing or EMBEDDING_SHARING
+    if sharing == "sidecar":
+        from embedding_server import EmbeddingClient
+
+        client = EmbeddingClient(EMBEDDING_SOCKET)
+        client.wait_until_ready()
+        return client
+    return load_embedding_model()
+
+
+class BulkEncoder:
+    """
+    Encodes many documents at once for ingestion.
+
+    Texts are sorted by length before batching, so every forward pass pads
+    headlines to headline length and long posts to post length instead of
+    padding a mixed batch to its longest member. With workers > 1 the sorted
+    list is split into chunks encoded by SentenceTransformer's multi-process
+    pool, one model copy per process. Vectors come back in input order.
+
+    Args:
+        model: A SentenceTransformer (see load_embedding_model)
+        workers: Encoding processes; 1 encodes in this process
+        batch_size: Texts per forward pass
+    """
+
+    def __init__(self, model, workers=1, batch_size=32):
+        self.model = model
+        self.workers = workers
+        self.batch_size = batch_size
+        # Spawns the workers, each loading its own copy of the model (a few seconds)
+        self.pool = model.start_multi_process_pool(["cpu"] * workers) if workers > 1 else None
+
+    @staticmethod
+    def length_order(texts):
+        """Indices that sort texts by length (characters, the proxy sentence-transformers uses for tokens)."""
+        return np.argsort([len(text) for text in texts], kind="stable")
+
+    def encode(self, texts):
+        if not len(texts):
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        order = self.length_order(texts)
+        ordered = [texts[i] for i in order]
+        if self.pool is not None:
+            # Contiguous chunks of the sorted list, so each worker also gets similar lengths
+            chunk_size = max(self.batch_size, -(-len(ordered) // (self.workers * 4)))
+            vectors = self.model.encode_multi_process(ordered, self.pool, batch_size=self.batch_size,
+                                                      chunk_size=chunk_size)
+        else:
+            vectors = self.model.encode(ordered, batch_size=self.batch_size, show_progress_bar=False,
+                                        convert_to_numpy=True)
+        restored = np.empty_like(vectors)
+        restored[order] = vectors
+        return restored
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def has_onnx_file(model_name, file_name):
+    """True for hub models (the hub repo ships quantized exports) or local dirs that contain the file."""
+    if not os.path.isdir(model_name):
+        return True
+    return os.path.exists(os.path.join(model_name, file_name))
+
+
+def export_int8_model(model_dir):
+    """Exports and int8-quantizes a local model directory in place (one-off, takes a few seconds)."""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    print(f"   -> Exporting int8 ONNX model to {model_dir}/onnx/ ...")
+    onnx_model = SentenceTransformer(model_dir, backend="onnx")
+    # "onnx/model_quint8_avx2.onnx" -> "avx2", "onnx/model_qint8_avx512_vnni.onnx" -> "avx512_vnni"
+    config = EMBEDDING_ONNX_INT8_FILE.split("_", 2)[-1].rsplit(".", 1)[0]
+    export_dynamic_quantized_onnx_model(onnx_model, quantization_config=config, model_name_or_path=model_dir)
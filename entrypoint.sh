@@ -20,8 +20,11 @@ echo "Starting FastAPI backend on port 8000..."
 # Use the & symbol to run in the background
 python main.py &
 
-# Wait for FastAPI to start
-sleep 5
+# Wait until FastAPI reports ready (model loaded, DB connected, caches warm), at most ~2 minutes
+for i in $(seq 1 120); do
+    python -c "import urllib.request; urllib.request.urlopen('http://localhost:8000/readyz')" 2>/dev/null && break
+    sleep 1
+done
 
 # --- 4. Start Streamlit Frontend ---
 echo "Starting Streamlit frontend on port 8501..."
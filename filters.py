@@ -0,0 +1,76 @@
+# filters.py
+"""
+Metadata filters for retrieval.
+
+The collectors store dates as 'YYYY-MM-DD' strings, which Chroma cannot range-filter.
+At ingest every document also gets `date_int` (e.g. 20251203), a sortable number,
+so date ranges become cheap $gte/$lte comparisons that shrink the search space
+before the vector search runs.
+"""
+from datetime import date, datetime
+
+
+def date_to_int(value):
+    """'2025-12-03' / date(2025, 12, 3) -> 20251203 (None if missing or unparseable)."""
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.year * 10000 + value.month * 100 + value.day
+    try:
+        return date_to_int(datetime.strptime(str(value)[:10], "%Y-%m-%d"))
+    except ValueError:
+        return None
+
+
+def with_derived_metadata(metadata):
+    """Copy of a document's metadata with the numeric fields used by range filters."""
+    derived = dict(metadata)
+    date_int = date_to_int(metadata.get('date'))
+    if date_int is not None:
+        derived['date_int'] = date_int
+    return derived
+
+
+def build_where(tickers=None, sources=None, categories=None, subreddits=None, date_from=None, date_to=None):
+    """
+    Translates optional filters into a Chroma `where` clause (None when no filter is set).
+
+    Lists match any of their values; dates are inclusive bounds.
+    """
+    clauses = []
+    for field, values in (("ticker", tickers), ("source", sources),
+                          ("category", categories), ("subreddit", subreddits)):
+        if values:
+            clauses.append({field: {"$in": list(values)}})
+
+    date_from, date_to = date_to_int(date_from), date_to_int(date_to)
+    if date_from is not None:
+        clauses.append({"date_int": {"$gte": date_from}})
+    if date_to is not None:
+        clauses.append({"date_int": {"$lte": date_to}})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def matches_where(metadata, where):
+    """Evaluates a where clause produced by build_where against one metadata dict (for non-Chroma retrievers)."""
+    if not where:
+        return True
+    if "$and" in where:
+        return all(matches_where(metadata, clause) for clause in where["$and"])
+    (field, condition), = where.items()
+    value = metadata.get(field)
+    for op, operand in condition.items():
+        if op == "$in" and value not in operand:
+            return False
+        if op == "$eq" and value != operand:
+            return False
+        if op == "$gte" and (value is None or value < operand):
+            return False
+        if op == "$lte" and (value is None or value > operand):
+            return False
+    return True
@@ -0,0 +1,220 @@
+# ingestion.py
+"""
+Streaming ingestion pipeline used by data_collector/load_to_chroma.py.
+
+    parse -> [queue] -> chunk -> [queue] -> encode -> [queue] -> write
+
+Each stage runs in its own thread and hands batches to the next through a queue
+of at most `queue_size` batches. The file is read lazily, so memory holds a few
+batches rather than the whole file, and Chroma writes (sqlite + HNSW, mostly
+outside the GIL) overlap with encoding the next batch. A slow stage fills its
+input queue and the stages before it block, so nothing grows without bound.
+
+Batches are dicts {"ids", "texts", "metadatas", ...}; stages add keys
+(e.g. "embeddings") and return the batch, or None to drop it. A stage that
+turns documents into several rows (chunking) sets "documents", so every stage
+counts documents, not rows.
+"""
+import json
+import time
+import queue
+import hashlib
+import threading
+
+_DONE = object()
+
+
+def content_hash(text, metadata):
+    """Fingerprint of everything stored for a document; equal hashes mean nothing to re-embed."""
+    payload = json.dumps(
+        {"text": text, "metadata": {key: value for key, value in metadata.items() if key != "content_hash"}},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def read_jsonl_batches(jsonl_file, batch_size, prepare_metadata=None):
+    """
+    Yields batches of documents from a collector file without reading it all.
+
+    Every metadata gets a content_hash (after `prepare_metadata`, e.g. derived
+    filter fields); entries without an id get one derived from their content.
+    Malformed lines are reported and skipped.
+    """
+    batch = {"ids": [], "texts": [], "metadatas": []}
+    with open(jsonl_file, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            try:
+                entry = json.loads(line)
+                text = entry['text']
+                metadata = prepare_metadata(entry['metadata']) if prepare_metadata else dict(entry['metadata'])
+            except json.JSONDecodeError:
+                print(f"   ⚠️  Skipping line {line_num}: Invalid JSON")
+                continue
+            except KeyError as e:
+                print(f"   ⚠️  Skipping line {line_num}: Missing field {e}")
+                continue
+            metadata['content_hash'] = content_hash(text, metadata)
+            batch["ids"].append(entry.get('id') or f"doc_{metadata['content_hash'][:16]}")
+            batch["texts"].append(text)
+            batch["metadatas"].append(metadata)
+            if len(batch["ids"]) >= batch_size:
+                yield batch
+                batch = {"ids": [], "texts": [], "metadatas": []}
+    if batch["ids"]:
+        yield batch
+
+
+def stored_versions(store, ids):
+    """
+    {id: (content_hash, chunk_count)} for the documents already in the collection
+    (no embeddings are read). A chunked document is found through its first
+    chunk, which keeps the document id (see chunking.py).
+    """
+    versions = {}
+    found = store.get(ids=list(ids), include=["documents", "metadatas"])
+    for doc_id, text, metadata in zip(found['ids'], found['documents'], found['metadatas']):
+        metadata = metadata or {}
+        # Documents loaded before content hashes existed are hashed from what is stored
+        versions[doc_id] = (metadata.get('content_hash') or content_hash(text, metadata),
+                            metadata.get('chunk_count', 1))
+    return versions
+
+
+class StageStats:
+    """Documents through one stage, time spent working on them and time blocked on its neighbours."""
+
+    def __init__(self, name):
+        self.name = name
+        self.batches = 0
+        self.documents = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.started = None
+        self.finished = None
+
+    def record(self, documents, seconds, failed=False):
+        self.batches += 1
+        self.busy_seconds += seconds
+        if failed:
+            self.failed += documents
+        else:
+            self.documents += documents
+
+    @property
+    def wall_seconds(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def docs_per_second(self):
+        """Throughput while actually working, i.e. what the stage could sustain if never starved."""
+        return self.documents / self.busy_seconds if self.busy_seconds else 0.0
+
+    def utilization(self):
+        return self.busy_seconds / self.wall_seconds if self.wall_seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "documents": self.documents,
+            "failed": self.failed,
+            "batches": self.batches,
+            "busy_s": round(self.busy_seconds, 2),
+            "wall_s": round(self.wall_seconds, 2),
+            "docs_per_s": round(self.docs_per_second(), 1),
+            "utilization": round(self.utilization(), 2),
+        }
+
+
+def _batch_size(batch):
+    """Documents in a batch (a chunked batch has more rows than documents)."""
+    return batch.get("documents", len(batch["ids"]))
+
+
+def _produce(source, outbox, stats, errors):
+    stats.started = time.perf_counter()
+    iterator = iter(source)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                break
+            stats.record(_batch_size(batch), time.perf_counter() - started)
+            outbox.put(batch)
+    except Exception as e:
+        # The source itself broke (unreadable file...): stop the whole pipeline
+        errors.append((stats.name, e))
+    finally:
+        stats.finished = time.perf_counter()
+        outbox.put(_DONE)
+
+
+def _work(func, inbox, outbox, stats):
+    stats.started = time.perf_counter()
+    while True:
+        batch = inbox.get()
+        if batch is _DONE:
+            break
+        started = time.perf_counter()
+        try:
+            result = func(batch)
+            stats.record(_batch_size(batch), time.perf_counter() - started)
+        except Exception as e:
+            # A failing batch only fails its own documents
+            print(f"\n⚠️  {stats.name} failed for a batch of {_batch_size(batch)} documents: {e}")
+            stats.record(_batch_size(batch), time.perf_counter() - started, failed=True)
+            result = None
+        if result is not None and outbox is not None:
+            outbox.put(result)
+    stats.finished = time.perf_counter()
+    if outbox is not None:
+        outbox.put(_DONE)
+
+
+def format_progress(stats):
+    return " | ".join(f"{s.name} {s.documents} docs ({s.documents / s.wall_seconds if s.wall_seconds else 0:.0f}/s)"
+                      for s in stats.values())
+
+
+def run_pipeline(source, stages, queue_size=4, report_every=5.0, source_name="parse"):
+    """
+    Runs `source` (an iterable of batches) through `stages`, a list of
+    (name, func) pairs, each stage in its own thread.
+
+    Args:
+        source: Iterable of batches, consumed lazily by the first stage
+        stages: [(name, func)] where func(batch) returns the batch for the next stage (or None to drop it)
+        queue_size: Batches that may wait between two stages
+        report_every: Seconds between progress lines (0 disables them)
+
+    Returns:
+        {stage name: StageStats}, in pipeline order
+    """
+    stats = {source_name: StageStats(source_name)}
+    stats.update((name, StageStats(name)) for name, _ in stages)
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    errors = []
+
+    threads = [threading.Thread(target=_produce, args=(source, queues[0], stats[source_name], errors),
+                                name=f"ingest-{source_name}", daemon=True)]
+    for i, (name, func) in enumerate(stages):
+        outbox = queues[i + 1] if i + 1 < len(stages) else None
+        threads.append(threading.Thread(target=_work, args=(func, queues[i], outbox, stats[name]),
+                                        name=f"ingest-{name}", daemon=True))
+    for thread in threads:
+        thread.start()
+
+    last = threads[-1]
+    while last.is_alive():
+        last.join(timeout=report_every or None)
+        if report_every and last.is_alive():
+            print(f"   [Ingest] {format_progress(stats)}")
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        name, error = errors[0]
+        raise RuntimeError(f"Ingestion stopped in the {name} stage: {error}") from error
+    return stats
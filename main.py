@@ -1,14 +1,228 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import numpy as np
 import uvicorn
-import chromadb
 import ollama
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
-from sentence_transformers import SentenceTransformer
+from datetime import date
+from typing import List, Optional
 
-# --- 1. Initialization ---
-app = FastAPI(title="Finance RAG API")
+from admission import CircuitBreaker, ClientDisconnected, GenerationQueue, Overloaded, cancel_on_disconnect
+from batching import EmbeddingBatcher
+from bm25 import BM25Index, rrf_fuse
+from caches import DiskEmbeddingCache, EmbeddingCache, SemanticAnswerCache
+from chunking import collapse_chunks, public_metadata
+from context_builder import build_context, extractive_answer
+from embeddings import embedding_model_id, load_embedding_model, load_query_encoder
+from filters import build_where
+from metrics import (
+    DEGRADED_ANSWERS, ENCODE_BATCH_SIZE, StageTimer, llm_timings, mark_worker_exited, observe_stage, render_metrics,
+    update_cache_gauges,
+)
+from prompts import build_messages
+from vector_store import open_vector_store
+from settings import (
+    API_WORKERS, PROMETHEUS_MULTIPROC_DIR, per_worker, OLLAMA_HOST, DEFAULT_MODEL, OLLAMA_KEEP_ALIVE, OLLAMA_NUM_CTX, LLM_MAX_CONCURRENCY,
+    LLM_QUEUE_MAX, LLM_QUEUE_MAX_BATCH, LLM_QUEUE_TIMEOUT, DISCONNECT_POLL_SECONDS, BATCH_MAX_QUERIES, BATCH_MAX_CONCURRENCY,
+    LLM_LATENCY_BUDGET, LLM_BREAKER_FAILURES, LLM_BREAKER_RESET, FALLBACK_MAX_SENTENCES,
+    EMBEDDING_BACKEND, EMBEDDING_SHARING, EMBEDDING_SOCKET, ENCODE_WORKERS, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL,
+    ENCODE_BATCH_MAX_SIZE, ENCODE_BATCH_WINDOW_MS, EMBEDDING_DISK_CACHE_PATH, EMBEDDING_DISK_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD,
+    CHROMA_PATH, VECTOR_STORE, RETRIEVAL_MODE, RRF_K, HYBRID_CANDIDATES, CHUNK_QUERY_CANDIDATES,
+    CONTEXT_TOKEN_BUDGET, CONTEXT_DOC_MAX_TOKENS, CONTEXT_DEDUPE_THRESHOLD,
+    CONTEXT_DISTANCE_GAP, CONTEXT_MAX_DISTANCE, prewarm_queries,
+)
+
+# --- 1. Shared State ---
+print("--- [System] Starting Backend (Lightweight Mode) ---")
+
+# Heavy resources are loaded by the warmup task started in lifespan(), not at import
+# time, so the process answers /livez right away and /readyz once everything is warm
+embedding_model = None
+if EMBEDDING_SHARING == "preload":
+    # Loaded at import so a pre-forking server (gunicorn --preload) loads it once in the
+    # master and the workers share its pages copy-on-write. No encode() runs before the
+    # fork: torch's thread pools do not survive it.
+    embedding_model = load_embedding_model()
+vector_store = None    # VectorStore: Chroma collection or in-memory NumPy matrix (VECTOR_STORE)
+keyword_index = None   # BM25 index, loaded unless RETRIEVAL_MODE=vector
+index_version = None   # collection_version() the in-memory indexes were built from
+index_refresh = None   # running refresh task, if any
+startup_state = {"phase": "starting", "error": None, "llm_error": None, "timings": {}}
+
+# Encoding is CPU-bound, so it gets its own small executor instead of competing
+# with cheap endpoints (/health) for the shared threadpool
+encode_executor = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="encode")
+ollama_client = ollama.AsyncClient(host=OLLAMA_HOST)
+# On-disk (model, text) -> vector cache shared with the loader and across restarts. Opened in
+# warm_up(), i.e. in each worker: an SQLite connection must not be inherited through fork (--preload)
+disk_embedding_cache = None
+embedding_id = embedding_model_id()
+
+def encode_batch(texts):
+    """Runs in the encode executor: on-disk cache first, the model only for the misses."""
+    if disk_embedding_cache is None:
+        ENCODE_BATCH_SIZE.observe(len(texts))
+        return embedding_model.encode(texts, show_progress_bar=False)
+    vectors = disk_embedding_cache.get_many(embedding_id, texts)
+    missing = [i for i, vec in enumerate(vectors) if vec is None]
+    if missing:
+        ENCODE_BATCH_SIZE.observe(len(missing))
+        encoded = embedding_model.encode([texts[i] for i in missing], show_progress_bar=False)
+        disk_embedding_cache.put_many(embedding_id, [texts[i] for i in missing], encoded)
+        for i, vec in zip(missing, encoded):
+            vectors[i] = vec
+    return vectors
+
+# Concurrent cache-miss encodes are grouped into one encode() call
+embedding_batcher = EmbeddingBatcher(
+    encode_batch,
+    encode_executor,
+    max_batch_size=ENCODE_BATCH_MAX_SIZE,
+    max_wait_ms=ENCODE_BATCH_WINDOW_MS,
+)
+# Caps in-flight generations; extra requests wait in a bounded priority queue
+# (interactive before batch) or are turned away with 429/503 + Retry-After.
+# Each of the API_WORKERS processes gets its share, so Ollama sees LLM_MAX_CONCURRENCY in total
+generation_queue = GenerationQueue(
+    max_concurrency=per_worker(LLM_MAX_CONCURRENCY),
+    queue_limits={"interactive": per_worker(LLM_QUEUE_MAX), "batch": per_worker(LLM_QUEUE_MAX_BATCH)},
+    max_wait_seconds=LLM_QUEUE_TIMEOUT,
+)
+# Stops calling an Ollama that keeps failing; answers are extracted from the sources until a probe succeeds
+llm_breaker = CircuitBreaker(failure_threshold=LLM_BREAKER_FAILURES, reset_seconds=LLM_BREAKER_RESET)
+NO_ANSWER = "I don't have specific information about this based on the available data."
+
+embedding_cache = EmbeddingCache(max_size=EMBEDDING_CACHE_SIZE, ttl_seconds=EMBEDDING_CACHE_TTL)
+# Answers for near-paraphrased questions are reused instead of regenerated
+answer_cache = SemanticAnswerCache(
+    max_size=ANSWER_CACHE_SIZE,
+    threshold=ANSWER_CACHE_THRESHOLD,
+    ttl_seconds=ANSWER_CACHE_TTL,
+)
+
+# --- 2. Startup ---
+def open_disk_embedding_cache():
+    if not EMBEDDING_DISK_CACHE_MAX_ENTRIES:
+        return None
+    cache = DiskEmbeddingCache(EMBEDDING_DISK_CACHE_PATH, max_entries=EMBEDDING_DISK_CACHE_MAX_ENTRIES)
+    print(f"   -> Disk embedding cache: {len(cache)} vectors at {EMBEDDING_DISK_CACHE_PATH}")
+    return cache
+
+def connect_vector_store():
+    global index_version
+    store = open_vector_store()
+    index_version = store.version()
+    print(f"   -> Connected ({store.engine}). Documents: {store.count()}")
+    return store
+
+def load_keyword_index():
+    index = BM25Index.load(CHROMA_PATH)
+    if index is None or len(index) != vector_store.count():
+        print("   -> Keyword index missing or stale, rebuilding from the collection...")
+        index = BM25Index.from_collection(vector_store)
+        index.save(CHROMA_PATH)
+    print(f"   -> Keyword index: {len(index)} documents")
+    return index
+
+def prewarm_embedding_cache():
+    # Doubles as the dummy encode that pays torch's first-call overhead before real traffic
+    warm_questions = prewarm_queries()
+    warm_vecs = embedding_model.encode(warm_questions, show_progress_bar=False)
+    for warm_question, warm_vec in zip(warm_questions, warm_vecs):
+        embedding_cache.put(warm_question, warm_vec.tolist())
+    print(f"   -> Cached {len(embedding_cache)} frequent queries.")
+
+def llm_options():
+    # num_ctx must be identical on every call: a different value makes Ollama reload the model
+    return {"num_ctx": OLLAMA_NUM_CTX}
+
+async def preload_llm():
+    # Loads the model and evaluates the fixed system prefix once, so the first real
+    # query already finds it in the KV cache
+    await ollama_client.chat(
+        model=DEFAULT_MODEL,
+        messages=build_messages("Hello", ""),
+        options={**llm_options(), "num_predict": 1},
+        keep_alive=OLLAMA_KEEP_ALIVE,
+    )
+
+async def run_phase(name: str, func):
+    """Runs one startup step (blocking steps in a worker thread) and records its duration."""
+    startup_state["phase"] = name
+    print(f"[Startup] {name}...")
+    started = time.perf_counter()
+    if asyncio.iscoroutinefunction(func):
+        result = await func()
+    else:
+        result = await run_in_threadpool(func)
+    elapsed = time.perf_counter() - started
+    startup_state["timings"][name] = round(elapsed, 3)
+    print(f"   -> {name} done in {elapsed:.2f}s")
+    return result
+
+async def warm_up():
+    global embedding_model, vector_store, keyword_index, disk_embedding_cache
+    started = time.perf_counter()
+    try:
+        # Small model 90MB; EMBEDDING_BACKEND picks PyTorch or the (quantized) ONNX export
+        if embedding_model is None:
+            embedding_model = await run_phase(f"embedding_model ({EMBEDDING_BACKEND}, sharing={EMBEDDING_SHARING})",
+                                              load_query_encoder)
+        disk_embedding_cache = await run_phase("disk_embedding_cache", open_disk_embedding_cache)
+        vector_store = await run_phase(f"vector_store ({VECTOR_STORE})", connect_vector_store)
+        if RETRIEVAL_MODE != "vector":
+            keyword_index = await run_phase("keyword_index", load_keyword_index)
+        await run_phase("embedding_warmup", prewarm_embedding_cache)
+    except Exception as e:
+        startup_state["phase"] = "failed"
+        startup_state["error"] = f"{type(e).__name__}: {e}"
+        print(f"[Startup] FAILED: {startup_state['error']}")
+        return
+
+    # Best effort: retrieval works without Ollama, so a missing LLM is reported but not fatal
+    try:
+        await run_phase("llm_preload", preload_llm)
+    except Exception as e:
+        startup_state["llm_error"] = f"{type(e).__name__}: {e}"
+        print(f"[Startup] WARNING: could not preload {DEFAULT_MODEL}: {startup_state['llm_error']}")
+
+    startup_state["timings"]["total"] = round(time.perf_counter() - started, 3)
+    startup_state["phase"] = "ready"
+    print(f"[Startup] Ready in {startup_state['timings']['total']:.2f}s")
+
+def ensure_ready():
+    if startup_state["phase"] != "ready":
+        raise HTTPException(
+            status_code=503,
+            detail=f"Backend not ready (phase: {startup_state['phase']})",
+            headers={"Retry-After": "5"},
+        )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = asyncio.create_task(warm_up())
+    yield
+    warmup_task.cancel()
+    await embedding_batcher.close()
+    encode_executor.shutdown(wait=False)
+    if disk_embedding_cache is not None:
+        disk_embedding_cache.close()
+    mark_worker_exited()
+
+# --- 3. Initialization ---
+app = FastAPI(title="Finance RAG API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,27 +232,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- 2. Load Resources ---
-print("--- [System] Starting Backend (Lightweight Mode) ---")
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # 429 (queue full) / 503 (waited too long): the client should come back later, not hang on
+    return JSONResponse({"detail": str(exc), "retry_after": exc.retry_after}, status_code=exc.status_code,
+                        headers={"Retry-After": str(exc.retry_after)})
 
-print("1. Loading Embedding Model...")
-# Small model 90MB
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-print("   -> Embedding Model loaded.")
-
-print("2. Connecting to ChromaDB...")
-try:
-    db_client = chromadb.PersistentClient(path="./chroma_db")
-    collection = db_client.get_collection("finance_documents")
-    print(f"   -> Connected. Documents: {collection.count()}")
-except Exception as e:
-    print(f"   -> Error: {e}")
-
-# --- 3. Data Models ---
+# --- 4. Data Models ---
 class QueryRequest(BaseModel):
     question: str
     n_results: int = 5
-    model: str = "llama3.2:3b" 
+    model: str = DEFAULT_MODEL
+    # Optional metadata filters, applied inside Chroma before the vector search
+    tickers: Optional[List[str]] = None
+    sources: Optional[List[str]] = None      # e.g. "Reddit", "Yahoo Finance"
+    categories: Optional[List[str]] = None
+    subreddits: Optional[List[str]] = None
+    date_from: Optional[date] = None         # inclusive, YYYY-MM-DD
+    date_to: Optional[date] = None           # inclusive, YYYY-MM-DD
+    include_timings: bool = False            # add a per-stage `timings` block to the response
+
+    def where(self):
+        return build_where(
+            tickers=self.tickers, sources=self.sources,
+            categories=self.categories, subreddits=self.subreddits,
+            date_from=self.date_from, date_to=self.date_to,
+        )
+
+    def cache_key(self):
+        """Answers are only reused for the same model, result count and filters."""
+        return (self.model, self.n_results, json.dumps(self.where(), sort_keys=True))
 
 class SourceDocument(BaseModel):
     text: str
@@ -49,103 +272,687 @@ class QueryResponse(BaseModel):
     answer: str
     sources: List[SourceDocument]
     used_model: str
+    cached: bool = False
+    degraded: bool = False                # extractive answer from the sources, the LLM was skipped
+    degraded_reason: Optional[str] = None  # "latency_budget", "llm_error" or "llm_unavailable" (breaker open)
+    context_tokens: Optional[int] = None  # estimated size of the context block
+    prompt_tokens: Optional[int] = None   # exact prompt size as counted by Ollama
+    timings: Optional[dict] = None        # per-stage milliseconds, only when include_timings is set
 
-# --- 4. Logic ---
-def retrieve_documents(question: str, n: int):
-    query_vec = embedding_model.encode(question).tolist()
-    results = collection.query(
-        query_embeddings=[query_vec],
-        n_results=n,
-        include=["documents", "metadatas", "distances"]
-    )
-    return results
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest]
+    stream: bool = False  # True -> NDJSON, one line per question as soon as it finishes
 
-def generate_answer(question: str, context: str, model_name: str):
-    prompt = f"""
-# CONTEXT #
-You are the generation component in a Retrieval-Augmented Generation (RAG) system.
-The user's query has been matched with the most relevant information from a financial knowledge base.
+class BatchQueryItem(BaseModel):
+    index: int
+    question: str
+    response: Optional[QueryResponse] = None
+    error: Optional[str] = None
 
-# OBJECTIVE #
-Answer the user's question accurately by synthesizing information from the retrieved content.
-Present the answer as inherent knowledge and do NOT reveal or mention the retrieval process.
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryItem]
 
-# STYLE #
-Clear, structured explanatory prose.
-Match the technical depth of the user's question.
-Typically 2–4 concise paragraphs unless otherwise required.
+# --- 5. Logic ---
+async def encode_query(question: str):
+    # Hot questions (sample buttons, frequent queries) skip the encoder entirely
+    query_vec = embedding_cache.get(question)
+    if query_vec is not None:
+        return query_vec
 
-# TONE #
-Confident, authoritative, and helpful.
-Avoid hedging language such as "might", "possibly", or "it seems" unless uncertainty is explicitly justified.
+    query_vec = await embedding_batcher.encode(question)
+    embedding_cache.put(question, query_vec)
+    return query_vec
 
-# AUDIENCE #
-End users seeking seamless financial analysis without knowledge of the backend system.
+async def encode_queries(questions: List[str]):
+    """Embeds many questions with a single encode() call for the cache misses."""
+    query_vecs = [embedding_cache.get(question) for question in questions]
+    missing = [i for i, vec in enumerate(query_vecs) if vec is None]
+    if missing:
+        loop = asyncio.get_running_loop()
+        encoded = await loop.run_in_executor(encode_executor, encode_batch, [questions[i] for i in missing])
+        for i, vec in zip(missing, encoded):
+            query_vecs[i] = vec.tolist()
+            embedding_cache.put(questions[i], query_vecs[i])
+    return query_vecs
 
-# RESPONSE #
-Context:
-{context}
+def collection_version():
+    """Changes whenever the collection's documents change; cached answers are tied to it."""
+    return vector_store.version()
 
-Query:
-{question}
+async def refresh_indexes(version):
+    """Reloads the in-memory indexes (NumPy matrix, BM25) after the loader changed the collection."""
+    global keyword_index, index_version
+    try:
+        if await run_in_threadpool(vector_store.refresh):
+            print(f"[Index] Vector store reloaded: {vector_store.count()} documents")
+        if keyword_index is not None:
+            index = await run_in_threadpool(BM25Index.from_collection, vector_store)
+            await run_in_threadpool(index.save, CHROMA_PATH)
+            keyword_index = index
+            print(f"[Index] Keyword index rebuilt: {len(index)} documents")
+        index_version = version
+    except Exception as e:
+        print(f"[Index] Index refresh failed: {e}")
 
-Rules:
-- Never mention "documents", "sources", "context", "database", or any retrieval-related terms.
-- Present all information as direct knowledge.
-- Only use facts contained in the provided context.
-- If relevant information is missing, respond exactly with:
-  "I don't have specific information about this based on the available data."
-- Synthesize across all content. Do NOT summarize document-by-document.
+async def current_version():
+    """
+    Version of the data this worker serves right now, which tags cached answers.
 
-Answer:
-"""
+    When the collection changed, the in-memory indexes are refreshed in the
+    background; until that finishes answers still come from the old indexes,
+    so they are cached under the old version (and dropped once it switches).
+    """
+    global index_refresh
+    version = await run_in_threadpool(collection_version)
+    if version != index_version:
+        if index_refresh is None or index_refresh.done():
+            index_refresh = asyncio.create_task(refresh_indexes(version))
+    return index_version
 
-    try:
-        response = ollama.chat(
-            model=model_name,
-            messages=[{"role": "user", "content": prompt}],
+def lookup_cached_answer(query_vec, request: QueryRequest, version):
+    cached, similarity = answer_cache.lookup(query_vec, request.cache_key(), version)
+    if cached is None:
+        return None
+    print(f"[Cache] Answer cache hit (similarity {similarity:.3f})")
+    return cached.copy(update={"cached": True})
+
+def retrieval_plan():
+    """(use_vector, use_keyword) for RETRIEVAL_MODE; falls back to vector search without a keyword index."""
+    if keyword_index is None or RETRIEVAL_MODE == "vector":
+        return True, False
+    if RETRIEVAL_MODE == "keyword":
+        return False, True
+    return True, True
+
+def chunk_hits(n: int):
+    """Chunks to retrieve for n documents: several chunks of one long post may match."""
+    return n * CHUNK_QUERY_CANDIDATES
+
+def candidate_count(chunks: int):
+    """Hybrid mode fetches extra candidates from each retriever so fusion has something to re-rank."""
+    use_vector, use_keyword = retrieval_plan()
+    return chunks * HYBRID_CANDIDATES if use_vector and use_keyword else chunks
+
+async def vector_search(query_vecs, n: int, where=None):
+    """One vector store query for one or many query vectors (one result list per vector)."""
+    with observe_stage("vector_search"):
+        return await run_in_threadpool(vector_store.query, query_vecs, n, where)
+
+async def keyword_search(question: str, n: int, where=None):
+    with observe_stage("keyword_search"):
+        return await run_in_threadpool(keyword_index.search, question, n, where)
+
+def vector_distance(query_vec, embedding):
+    """Distance in the collection's own metric, so keyword-only hits get comparable relevance scores."""
+    space = vector_store.space
+    q, e = np.asarray(query_vec, dtype=np.float32), np.asarray(embedding, dtype=np.float32)
+    if space == "cosine":
+        return float(1 - q @ e / (np.linalg.norm(q) * np.linalg.norm(e)))
+    if space == "ip":
+        return float(1 - q @ e)
+    return float(np.sum((q - e) ** 2))
+
+async def fuse_results(query_vec, vector_results, keyword_hits, n: int):
+    """
+    Reciprocal-rank fusion of a single-query vector result and BM25 hits,
+    returned in the same shape as collection.query so build_sources works unchanged.
+    """
+    known = {}
+    if vector_results is not None:
+        for doc_id, doc, meta, dist in zip(vector_results['ids'][0], vector_results['documents'][0],
+                                           vector_results['metadatas'][0], vector_results['distances'][0]):
+            known[doc_id] = (doc, meta, dist)
+    vector_ids = list(known)
+    ranked = rrf_fuse([vector_ids, [doc_id for doc_id, _ in keyword_hits]], n, k=RRF_K)
+
+    missing = [doc_id for doc_id in ranked if doc_id not in known]
+    if missing:
+        fetched = await run_in_threadpool(
+            vector_store.get, ids=missing, include=["documents", "metadatas", "embeddings"]
         )
-        return response["message"]["content"]
-    except Exception as e:
-        return f"Error generating answer: {str(e)}"
+        for doc_id, doc, meta, emb in zip(fetched['ids'], fetched['documents'],
+                                          fetched['metadatas'], fetched['embeddings']):
+            known[doc_id] = (doc, meta, vector_distance(query_vec, emb))
+
+    ranked = [doc_id for doc_id in ranked if doc_id in known]
+    return {
+        "ids": [ranked],
+        "documents": [[known[doc_id][0] for doc_id in ranked]],
+        "metadatas": [[known[doc_id][1] for doc_id in ranked]],
+        "distances": [[known[doc_id][2] for doc_id in ranked]],
+    }
+
+async def retrieve_chunks(question: str, query_vec, chunks: int, where=None):
+    """Top `chunks` hits (vector, BM25 or fused) and whether the retrievers ran out of hits before that."""
+    use_vector, use_keyword = retrieval_plan()
+    if not use_keyword:
+        results = await vector_search([query_vec], chunks, where)
+        return results, retrievers_exhausted(results, None, chunks)
+
+    candidates = candidate_count(chunks)
+    if use_vector:
+        # Both retrievers run at the same time
+        vector_results, keyword_hits = await asyncio.gather(
+            vector_search([query_vec], candidates, where),
+            keyword_search(question, candidates, where),
+        )
+    else:
+        vector_results, keyword_hits = None, await keyword_search(question, candidates, where)
+    return (await fuse_results(query_vec, vector_results, keyword_hits, chunks),
+            retrievers_exhausted(vector_results, keyword_hits, candidates))
 
-# --- 5. API ---
+def retrievers_exhausted(vector_results, keyword_hits, candidates: int):
+    """True when neither retriever had `candidates` hits, i.e. a wider search finds nothing new."""
+    if vector_results is not None and len(vector_results['ids'][0]) >= candidates:
+        return False
+    return keyword_hits is None or len(keyword_hits) < candidates
+
+def found_documents(documents, n: int):
+    return len(documents['ids'][0]) >= n if documents['ids'] else False
+
+async def retrieve_documents(question: str, query_vec, n: int, where=None, chunks=None):
+    """
+    Top n documents for a question. Chunk hits are collapsed to their parent document;
+    when a few long posts take most of the hits, the search is widened (doubling the
+    chunks fetched) until n parents are found or the retrievers run out.
+    """
+    chunks = chunks or chunk_hits(n)
+    while True:
+        results, exhausted = await retrieve_chunks(question, query_vec, chunks, where)
+        documents = collapse_chunks(results, n)
+        if exhausted or found_documents(documents, n):
+            return documents
+        chunks *= 2
+
+def select_results(results, index: int, n: int):
+    """Single-query view of a batched Chroma result, trimmed to the top n hits."""
+    return {key: [results[key][index][:n]] for key in ("ids", "documents", "metadatas", "distances")}
+
+def build_sources(question: str, results):
+    """
+    Turns raw Chroma results into SourceDocuments plus the LLM context block.
+    Only hits that survive the context builder (relevance cutoff, de-duplication,
+    token budget) are returned as sources.
+    """
+    selected, context_text, context_tokens = build_context(
+        question, results,
+        token_budget=CONTEXT_TOKEN_BUDGET,
+        doc_max_tokens=CONTEXT_DOC_MAX_TOKENS,
+        dedupe_threshold=CONTEXT_DEDUPE_THRESHOLD,
+        distance_gap=CONTEXT_DISTANCE_GAP,
+        max_distance=CONTEXT_MAX_DISTANCE,
+    )
+    sources = [
+        SourceDocument(text=doc, metadata=public_metadata(meta), relevance_score=(1 - dist) * 100)
+        for doc, meta, dist in selected
+    ]
+    retrieved = len(results['documents'][0]) if results['documents'] else 0
+    print(f"[Context] {len(selected)}/{retrieved} docs, ~{context_tokens} tokens")
+    return sources, context_text, context_tokens
+
+async def generate_answer(question: str, context: str, model_name: str, priority: str = "interactive"):
+    """
+    Returns Ollama's full chat response (message plus prompt/eval counters).
+    Raises asyncio.TimeoutError when Ollama misses LLM_LATENCY_BUDGET, counted from
+    the moment a generation slot is free (the wait for it is LLM_QUEUE_TIMEOUT's job).
+    """
+    async with generation_queue.slot(priority):
+        response = await asyncio.wait_for(ollama_client.chat(
+            model=model_name,
+            messages=build_messages(question, context),
+            options=llm_options(),
+            keep_alive=OLLAMA_KEEP_ALIVE,
+        ), LLM_LATENCY_BUDGET)
+    return response
+
+def remaining_budget(deadline):
+    return None if deadline is None else max(0.0, deadline - time.perf_counter())
+
+async def stream_answer(question: str, context: str, model_name: str, stats=None, priority: str = "interactive"):
+    """
+    Yields answer tokens as Ollama produces them; the final chunk's counters go into `stats`.
+    Only the first token races LLM_LATENCY_BUDGET (from the moment the slot is free):
+    asyncio.TimeoutError is raised before anything was yielded, never mid-answer.
+    """
+    async with generation_queue.slot(priority):
+        deadline = time.perf_counter() + LLM_LATENCY_BUDGET if LLM_LATENCY_BUDGET else None
+        stream = await asyncio.wait_for(ollama_client.chat(
+            model=model_name,
+            messages=build_messages(question, context),
+            options=llm_options(),
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            stream=True,
+        ), remaining_budget(deadline))
+        chunks = stream.__aiter__()
+        while True:
+            try:
+                next_chunk = chunks.__anext__()
+                chunk = await (next_chunk if deadline is None else asyncio.wait_for(next_chunk, remaining_budget(deadline)))
+            except StopAsyncIteration:
+                break
+            token = chunk["message"]["content"]
+            if token:
+                deadline = None  # the answer has started: it is never swapped out
+                yield token
+            if chunk.get("done") and stats is not None:
+                stats["final"] = chunk
+
+def degraded_response(request: QueryRequest, sources, context_tokens, timer: StageTimer, endpoint: str, reason: str):
+    """Fast answer made of the most question-relevant retrieved sentences; never cached."""
+    print(f"[LLM] Degraded answer ({reason})")
+    timer.outcome = "degraded"
+    DEGRADED_ANSWERS.labels(endpoint, reason).inc()
+    answer = extractive_answer(request.question, [source.text for source in sources], FALLBACK_MAX_SENTENCES)
+    return QueryResponse(answer=answer or NO_ANSWER, sources=sources, used_model="extractive",
+                         degraded=True, degraded_reason=reason, context_tokens=context_tokens)
+
+# --- 6. API ---
 # Add /health check endpoint to resolve 404 error from frontend
 @app.get("/health")
 def health_check():
     """Returns the status and current document count of the vector store."""
     try:
         # Get the document count
-        count = collection.count()
+        count = vector_store.count()
     except Exception:
-        # If DB connection fails (unlikely if initialization worked), return 0
+        # Still starting, or the DB connection failed
         count = 0 
         
     # The frontend expects a 200 OK status and the document count
-    return {"status": "ok", "total_documents": count}
+    status = "ok" if startup_state["phase"] == "ready" else startup_state["phase"]
+    return {"status": status, "total_documents": count}
+
+@app.get("/livez")
+def liveness():
+    """The process is up and serving HTTP (says nothing about the pipeline)."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+def readiness():
+    """200 once the model is loaded, the collection is open and the caches are warm; 503 before that."""
+    body = {
+        "status": "ready" if startup_state["phase"] == "ready" else startup_state["phase"],
+        "error": startup_state["error"],
+        "llm_error": startup_state["llm_error"],
+        "timings": startup_state["timings"],
+    }
+    return JSONResponse(body, status_code=200 if startup_state["phase"] == "ready" else 503)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: per-stage latency histograms, LLM TTFT / tokens per second, cache counters."""
+    caches = {"embedding": embedding_cache, "answer": answer_cache}
+    if disk_embedding_cache is not None:
+        caches["disk_embedding"] = disk_embedding_cache
+    update_cache_gauges(caches)
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/stats")
+def stats():
+    """Cache counters for the query pipeline (of the worker that answers; /metrics covers all of them)."""
+    return {
+        "worker": {"pid": os.getpid(), "workers": API_WORKERS},
+        "vector_store": vector_store.stats() if vector_store is not None else None,
+        "embedding_cache": embedding_cache.stats(),
+        "disk_embedding_cache": disk_embedding_cache.stats() if disk_embedding_cache is not None else None,
+        "answer_cache": answer_cache.stats(),
+        "encode_batching": embedding_batcher.stats(),
+        "generation_queue": generation_queue.stats(),
+        "llm_breaker": llm_breaker.stats(),
+    }
 
 @app.post("/query", response_model=QueryResponse)
-def query_rag(request: QueryRequest):
+async def query_rag(request: QueryRequest, http_request: Request):
+    ensure_ready()
     print(f"\n[Query] {request.question}")
+    timer = StageTimer()
     
+    with timer.stage("encode"):
+        query_vec = await encode_query(request.question)
+    with timer.stage("answer_cache"):
+        version = await current_version()
+        cached = lookup_cached_answer(query_vec, request, version)
+    if cached is not None:
+        timer.outcome = "cached"
+        timer.finish("query")
+        return with_timings(cached, request, timer)
+
+    admit(timer, "query")
+
     # 1. Search
-    results = retrieve_documents(request.question, request.n_results)
-    
-    sources = []
-    context_text = ""
-    if results['documents']:
-        for i in range(len(results['documents'][0])):
-            doc = results['documents'][0][i]
-            meta = results['metadatas'][0][i]
-            score = (1 - results['distances'][0][i]) * 100
-            sources.append(SourceDocument(text=doc, metadata=meta, relevance_score=score))
-            context_text += f"- {doc}\n"
-
-    # 2. Generate 
+    with timer.stage("retrieve"):
+        results = await retrieve_documents(request.question, query_vec, request.n_results, request.where())
+
+    # 2. Generate (abandoned as soon as the client hangs up)
+    try:
+        response = await cancel_on_disconnect(
+            http_request, answer_from_results(request, query_vec, version, results, timer), DISCONNECT_POLL_SECONDS
+        )
+    except ClientDisconnected:
+        print("[Query] Client disconnected, generation cancelled")
+        timer.outcome = "cancelled"
+        timer.finish("query")
+        return Response(status_code=499)
+    except Overloaded:
+        timer.outcome = "rejected"
+        timer.finish("query")
+        raise
+    timer.finish("query")
+    return with_timings(response, request, timer)
+
+def admit(timer: StageTimer, endpoint: str, priority: str = "interactive"):
+    """Turns the request away before retrieval if the generation queue has no room for it."""
+    try:
+        generation_queue.check(priority)
+    except Overloaded:
+        timer.outcome = "rejected"
+        timer.finish(endpoint)
+        raise
+
+def with_timings(response: QueryResponse, request: QueryRequest, timer: StageTimer):
+    if not request.include_timings:
+        return response
+    return response.copy(update={"timings": dict(timer.timings)})
+
+async def answer_from_results(request: QueryRequest, query_vec, version, results, timer: StageTimer,
+                              priority: str = "interactive", endpoint: str = "query"):
+    """
+    Generates the answer for retrieved results. When Ollama misses LLM_LATENCY_BUDGET
+    once the generation started, on an Ollama error, or while the breaker is open, an
+    extractive answer flagged `degraded` is returned instead. A request that cannot
+    get a generation slot within LLM_QUEUE_TIMEOUT raises QueueTimeout (503).
+    """
+    with timer.stage("context"):
+        sources, context_text, context_tokens = build_sources(request.question, results)
+
+    if not llm_breaker.allow():
+        return degraded_response(request, sources, context_tokens, timer, endpoint, "llm_unavailable")
+
     print(f"[LLM] Generating with {request.model}...")
-    answer = generate_answer(request.question, context_text, request.model)
-    
-    return QueryResponse(answer=answer, sources=sources, used_model=request.model)
+    try:
+        with timer.stage("generate"):
+            llm_response = await generate_answer(request.question, context_text, request.model, priority)
+    except asyncio.TimeoutError:
+        llm_breaker.record_failure()
+        return degraded_response(request, sources, context_tokens, timer, endpoint, "latency_budget")
+    except (Overloaded, asyncio.CancelledError):
+        llm_breaker.release_probe()
+        raise
+    except Exception as e:
+        print(f"[LLM] Generation failed: {e}")
+        llm_breaker.record_failure()
+        return degraded_response(request, sources, context_tokens, timer, endpoint, "llm_error")
+    llm_breaker.record_success()
+
+    timer.add(**llm_timings(request.model, llm_response))
+    response = QueryResponse(answer=llm_response["message"]["content"], sources=sources, used_model=request.model,
+                             context_tokens=context_tokens, prompt_tokens=llm_response.get("prompt_eval_count"))
+    if response.answer:
+        answer_cache.store(query_vec, request.cache_key(), version, response)
+    return response
+
+@app.post("/query/stream")
+async def query_rag_stream(request: QueryRequest):
+    """
+    Same pipeline as /query, streamed as NDJSON (one JSON object per line):
+      {"type": "sources", "sources": [...], "used_model": "..."}  - sent first
+      {"type": "token", "content": "..."}                        - one per LLM chunk
+      {"type": "done", "prompt_tokens": N} or {"type": "error", "message": "..."}  - last line
+    The done event carries "cached": true when the answer came from the answer cache, and
+    "degraded": true when an extractive answer replaced an LLM that missed the latency budget or failed.
+    When the client disconnects mid-stream the generation is cancelled.
+    """
+    ensure_ready()
+    print(f"\n[Query/stream] {request.question}")
+    timer = StageTimer()
+
+    # Retrieval happens before the response starts so errors still map to HTTP status codes
+    with timer.stage("encode"):
+        query_vec = await encode_query(request.question)
+    with timer.stage("answer_cache"):
+        version = await current_version()
+        cached = lookup_cached_answer(query_vec, request, version)
+    if cached is not None:
+        sources, context_text, context_tokens = cached.sources, None, cached.context_tokens
+    else:
+        admit(timer, "query_stream")
+        with timer.stage("retrieve"):
+            results = await retrieve_documents(request.question, query_vec, request.n_results, request.where())
+        with timer.stage("context"):
+            sources, context_text, context_tokens = build_sources(request.question, results)
+
+    def done_event(**fields):
+        if request.include_timings:
+            fields["timings"] = timer.timings
+        return json.dumps({"type": "done", **fields}) + "\n"
+
+    async def event_stream():
+        yield json.dumps({
+            "type": "sources",
+            "sources": [source.dict() for source in sources],
+            "used_model": request.model,
+            "cached": cached is not None,
+            "context_tokens": context_tokens,
+        }) + "\n"
+
+        if cached is not None:
+            timer.outcome = "cached"
+            timer.finish("query_stream")
+            yield json.dumps({"type": "token", "content": cached.answer}) + "\n"
+            yield done_event(prompt_tokens=cached.prompt_tokens, cached=True)
+            return
+
+        def degraded_events(reason):
+            response = degraded_response(request, sources, context_tokens, timer, "query_stream", reason)
+            timer.finish("query_stream")
+            yield json.dumps({"type": "token", "content": response.answer}) + "\n"
+            yield done_event(prompt_tokens=None, degraded=True, degraded_reason=reason)
+
+        if not llm_breaker.allow():
+            for line in degraded_events("llm_unavailable"):
+                yield line
+            return
+
+        print(f"[LLM] Streaming with {request.model}...")
+        tokens = []
+        llm_stats = {}
+        first_token_at = None
+        generate_started = time.perf_counter()
+        token_stream = stream_answer(request.question, context_text, request.model, llm_stats)
+        try:
+            with timer.stage("generate"):
+                # stream_answer raises TimeoutError only before the first token (latency budget)
+                try:
+                    token = await token_stream.__anext__()
+                except StopAsyncIteration:
+                    token = None
+                # Ollama answered, even if with nothing: either way a half-open probe is settled
+                llm_breaker.record_success()
+                if token is not None:
+                    first_token_at = time.perf_counter()
+                while token is not None:
+                    tokens.append(token)
+                    yield json.dumps({"type": "token", "content": token}) + "\n"
+                    try:
+                        token = await token_stream.__anext__()
+                    except StopAsyncIteration:
+                        token = None
+        except asyncio.TimeoutError:
+            llm_breaker.record_failure()
+            for line in degraded_events("latency_budget"):
+                yield line
+            return
+        except asyncio.CancelledError:
+            # Starlette cancels the response when the client disconnects; leaving the
+            # generator closes the Ollama stream, which stops the generation
+            print("[Query/stream] Client disconnected, generation cancelled")
+            llm_breaker.release_probe()
+            timer.outcome = "cancelled"
+            timer.finish("query_stream")
+            raise
+        except Overloaded as e:
+            llm_breaker.release_probe()
+            timer.outcome = "rejected"
+            timer.finish("query_stream")
+            yield json.dumps({"type": "error", "message": str(e), "retry_after": e.retry_after}) + "\n"
+            return
+        except Exception as e:
+            print(f"[LLM] Generation failed: {e}")
+            llm_breaker.record_failure()
+            if not tokens:
+                for line in degraded_events("llm_error"):
+                    yield line
+                return
+            timer.outcome = "error"
+            timer.finish("query_stream")
+            yield json.dumps({"type": "error", "message": f"Error generating answer: {str(e)}"}) + "\n"
+            return
+        finally:
+            await token_stream.aclose()
+
+        final = llm_stats.get("final") or {}
+        ttft = first_token_at - generate_started if first_token_at is not None else None
+        timer.add(**llm_timings(request.model, final, ttft))
+        timer.finish("query_stream")
+        response = QueryResponse(answer="".join(tokens), sources=sources, used_model=request.model,
+                                 context_tokens=context_tokens, prompt_tokens=final.get("prompt_eval_count"))
+        if tokens:
+            # An empty answer would be served to every similar question
+            answer_cache.store(query_vec, request.cache_key(), version, response)
+        yield done_event(prompt_tokens=response.prompt_tokens)
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_rag_batch(batch: BatchQueryRequest, http_request: Request):
+    """
+    Answers many questions at once: one encode() call for all questions, one
+    vector store query for all vectors, then generations run concurrently
+    (at most BATCH_MAX_CONCURRENCY per batch). A failing question only fails its own item.
+    Generations queue with batch priority, behind interactive requests.
+    """
+    ensure_ready()
+    if not batch.queries:
+        raise HTTPException(status_code=400, detail="queries must not be empty")
+    if len(batch.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    print(f"\n[Query/batch] {len(batch.queries)} questions")
+    batch_timer = StageTimer()
+
+    # 1. Encode + answer-cache lookups
+    with batch_timer.stage("batch_encode"):
+        query_vecs = await encode_queries([q.question for q in batch.queries])
+    with batch_timer.stage("answer_cache"):
+        version = await current_version()
+        cached = [lookup_cached_answer(vec, q, version) for q, vec in zip(batch.queries, query_vecs)]
+
+    if any(response is None for response in cached):
+        admit(batch_timer, "query_batch", priority="batch")
+
+    # 2. Search: one vector round trip per distinct filter (a single one when no filters are used)
+    use_vector, use_keyword = retrieval_plan()
+    groups = {}
+    for i, response in enumerate(cached):
+        if response is None:
+            groups.setdefault(json.dumps(batch.queries[i].where(), sort_keys=True), []).append(i)
+
+    result_row = {}  # question index -> (group results, row in those results)
+    with batch_timer.stage("batch_retrieve"):
+        for where_key, indices in (groups.items() if use_vector else ()):
+            max_n = max(candidate_count(chunk_hits(batch.queries[i].n_results)) for i in indices)
+            group_results = await vector_search([query_vecs[i] for i in indices], max_n, json.loads(where_key))
+            for row, index in enumerate(indices):
+                result_row[index] = (group_results, row)
+
+    async def search_item(index: int):
+        request = batch.queries[index]
+        n, chunks = request.n_results, chunk_hits(request.n_results)
+        candidates = candidate_count(chunks)
+        vector_results = keyword_hits = None
+        if use_vector:
+            group_results, row = result_row[index]
+            vector_results = select_results(group_results, row, candidates)
+        if use_keyword:
+            keyword_hits = await keyword_search(request.question, candidates, request.where())
+            results = await fuse_results(query_vecs[index], vector_results, keyword_hits, chunks)
+        else:
+            results = vector_results
+        documents = collapse_chunks(results, n)
+        if found_documents(documents, n) or retrievers_exhausted(vector_results, keyword_hits, candidates):
+            return documents
+        # A few long posts took most of the hits: widen this question's search on its own
+        return await retrieve_documents(request.question, query_vecs[index], n, request.where(), chunks=2 * chunks)
+
+    # 3. Generate concurrently; each item's latency budget starts when its generation does
+    batch_semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def run_item(index: int):
+        request = batch.queries[index]
+        item = BatchQueryItem(index=index, question=request.question)
+        timer = StageTimer()
+        timer.add(**batch_timer.timings)
+        try:
+            if cached[index] is not None:
+                timer.outcome = "cached"
+                item.response = cached[index]
+            else:
+                async with batch_semaphore:
+                    with timer.stage("search"):
+                        item_results = await search_item(index)
+                    item.response = await answer_from_results(request, query_vecs[index], version, item_results, timer,
+                                                              priority="batch", endpoint="query_batch")
+            item.response = with_timings(item.response, request, timer)
+        except Exception as e:
+            timer.outcome = "error"
+            item.error = str(e)
+        timer.finish("query_batch_item")
+        return item
+
+    tasks = [asyncio.create_task(run_item(i)) for i in range(len(batch.queries))]
+
+    if batch.stream:
+        async def item_stream():
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    item = await finished
+                    yield item.json() + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+        return StreamingResponse(item_stream(), media_type="application/x-ndjson")
+
+    try:
+        results = await cancel_on_disconnect(http_request, asyncio.gather(*tasks), DISCONNECT_POLL_SECONDS)
+    except ClientDisconnected:
+        print("[Query/batch] Client disconnected, generations cancelled")
+        return Response(status_code=499)
+    return BatchQueryResponse(results=results)
+
+def run_server():
+    if API_WORKERS > 1:
+        if LLM_MAX_CONCURRENCY < API_WORKERS:
+            print(f"[System] LLM_MAX_CONCURRENCY={LLM_MAX_CONCURRENCY} < API_WORKERS={API_WORKERS}: "
+                  f"each worker still runs 1 generation, {API_WORKERS} in total")
+        if not PROMETHEUS_MULTIPROC_DIR:
+            # Set before the workers import prometheus_client, so /metrics aggregates all of them
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="rag-metrics-")
+        # Each worker imports this module on its own; use VECTOR_STORE=snapshot so they share one mapped matrix
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=API_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    sidecar = None
+    if EMBEDDING_SHARING == "sidecar":
+        # One model for all workers; they connect to it during their warmup
+        server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_server.py")
+        sidecar = subprocess.Popen([sys.executable, server_script, "--socket", EMBEDDING_SOCKET])
+    elif EMBEDDING_SHARING == "preload" and API_WORKERS > 1:
+        print("[System] uvicorn starts workers with spawn, not fork: use "
+              "`gunicorn main:app --preload -w N -k uvicorn.workers.UvicornWorker` to share the preloaded model")
+    try:
+        run_server()
+    finally:
+        if sidecar is not None:
+            sidecar.terminate()
@@ -0,0 +1,156 @@
+# metrics.py
+"""
+Per-stage latency instrumentation and Prometheus metrics for the query pipeline.
+
+Every request gets a StageTimer; each `with timer.stage("..."):` block is observed
+into the rag_stage_seconds histogram and, if the client asked for it, returned as
+the `timings` block of the response. LLM counters come from the fields Ollama puts
+on its final response (eval_count, eval_duration, prompt_eval_duration, ...).
+
+With several API workers, PROMETHEUS_MULTIPROC_DIR must be set before this module
+is imported: every worker then writes its values there and /metrics aggregates
+all of them (gauges are summed over live workers; the breaker reports the worst state).
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Time spent in each stage of the query pipeline", ["stage"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter("rag_requests_total", "Query requests by endpoint and outcome", ["endpoint", "outcome"])
+REQUEST_SECONDS = Histogram(
+    "rag_request_seconds", "End-to-end query latency", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+LLM_TTFT_SECONDS = Histogram(
+    "rag_llm_ttft_seconds", "Time to first generated token", ["model"], buckets=LATENCY_BUCKETS
+)
+LLM_PROMPT_EVAL_SECONDS = Histogram(
+    "rag_llm_prompt_eval_seconds", "Ollama prompt evaluation (prefill) time", ["model"], buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "rag_llm_tokens_per_second", "Ollama generation speed", ["model"],
+    buckets=(1, 2.5, 5, 10, 15, 20, 30, 40, 60, 80, 120, 200),
+)
+LLM_TOKENS = Counter("rag_llm_tokens_total", "Tokens processed by Ollama", ["model", "kind"])
+ENCODE_BATCH_SIZE = Histogram(
+    "rag_encode_batch_size", "Questions per micro-batched encode() call", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+LLM_ACTIVE = Gauge("rag_llm_active_generations", "Generations currently running", multiprocess_mode="livesum")
+QUEUE_DEPTH = Gauge("rag_llm_queue_depth", "Requests waiting for a generation slot", ["priority"],
+                    multiprocess_mode="livesum")
+QUEUE_WAIT_SECONDS = Histogram(
+    "rag_llm_queue_wait_seconds", "Time spent waiting for a generation slot", ["priority"], buckets=LATENCY_BUCKETS
+)
+QUEUE_REJECTED = Counter("rag_llm_queue_rejected_total", "Requests turned away by admission control",
+                         ["priority", "reason"])
+LLM_BREAKER_STATE = Gauge("rag_llm_breaker_state", "Ollama circuit breaker: 0 closed, 1 half-open, 2 open",
+                          multiprocess_mode="livemax")
+DEGRADED_ANSWERS = Counter("rag_degraded_answers_total", "Extractive answers served instead of the LLM",
+                           ["endpoint", "reason"])
+CACHE_SIZE = Gauge("rag_cache_entries", "Entries currently held by a cache", ["cache"], multiprocess_mode="livesum")
+CACHE_LOOKUPS = Gauge("rag_cache_lookups", "Cache lookups since startup", ["cache", "result"],
+                      multiprocess_mode="livesum")
+
+
+@contextmanager
+def observe_stage(name):
+    """Observes a block into rag_stage_seconds without attaching it to a request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+class StageTimer:
+    """Collects per-stage durations (milliseconds) and the outcome of one request."""
+
+    def __init__(self):
+        self.timings = {}
+        self.outcome = "ok"
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            STAGE_SECONDS.labels(name).observe(elapsed)
+            self.timings[f"{name}_ms"] = round(elapsed * 1000, 2)
+
+    def add(self, **values):
+        self.timings.update(values)
+
+    def summary(self):
+        return " ".join(f"{key}={value}" for key, value in self.timings.items())
+
+    def finish(self, endpoint):
+        """Records the end-to-end latency and outcome of the request."""
+        elapsed = time.perf_counter() - self.started
+        REQUEST_SECONDS.labels(endpoint).observe(elapsed)
+        REQUESTS.labels(endpoint, self.outcome).inc()
+        self.timings["total_ms"] = round(elapsed * 1000, 2)
+        print(f"[Timing] {endpoint} {self.outcome}: {self.summary()}")
+
+
+def llm_timings(model, response, ttft_seconds=None):
+    """
+    Records Ollama's counters from a final (non-stream or done) response and returns
+    them as a timings dict. Without a measured TTFT (non-streaming calls) it is
+    approximated by Ollama's load + prefill time, which is when the first token is produced.
+    """
+    nanos = 1e9
+    prompt_tokens = response.get("prompt_eval_count") or 0
+    completion_tokens = response.get("eval_count") or 0
+    prompt_eval = (response.get("prompt_eval_duration") or 0) / nanos
+    eval_seconds = (response.get("eval_duration") or 0) / nanos
+    if ttft_seconds is None:
+        ttft_seconds = (response.get("load_duration") or 0) / nanos + prompt_eval
+
+    LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(model, "completion").inc(completion_tokens)
+    LLM_PROMPT_EVAL_SECONDS.labels(model).observe(prompt_eval)
+    LLM_TTFT_SECONDS.labels(model).observe(ttft_seconds)
+    tokens_per_second = completion_tokens / eval_seconds if eval_seconds else 0.0
+    if tokens_per_second:
+        LLM_TOKENS_PER_SECOND.labels(model).observe(tokens_per_second)
+
+    return {
+        "ttft_ms": round(ttft_seconds * 1000, 2),
+        "prompt_eval_ms": round(prompt_eval * 1000, 2),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens_per_second": round(tokens_per_second, 2),
+    }
+
+
+def update_cache_gauges(caches):
+    """caches: name -> object with stats() returning size/hits/misses."""
+    for name, cache in caches.items():
+        stats = cache.stats()
+        CACHE_SIZE.labels(name).set(stats["size"])
+        CACHE_LOOKUPS.labels(name, "hit").set(stats["hits"])
+        CACHE_LOOKUPS.labels(name, "miss").set(stats["misses"])
+
+
+def mark_worker_exited():
+    """Drops this worker's live gauges from the aggregated /metrics (no-op outside multiprocess mode)."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def render_metrics():
+    """(body, content_type) for the /metrics endpoint, summed over all workers in multiprocess mode."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,137 @@
+# settings.py
+"""
+Backend configuration, read from environment variables.
+Defaults match the single-machine setup described in the README.
+"""
+import os
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def read_lines(path):
+    """Non-empty, non-comment lines of a text file ([] if the file does not exist)."""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+# --- Ollama / generation ---
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")  # None -> ollama library default (http://localhost:11434)
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "llama3.2:3b")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # how long Ollama keeps the model (and its KV cache) loaded
+OLLAMA_NUM_CTX = env_int("OLLAMA_NUM_CTX", 4096)  # context window; keep constant or the model reloads
+LLM_MAX_CONCURRENCY = env_int("LLM_MAX_CONCURRENCY", 2)  # generations allowed in flight at once
+LLM_QUEUE_MAX = env_int("LLM_QUEUE_MAX", 16)  # waiting generations before interactive requests get 429
+LLM_QUEUE_MAX_BATCH = env_int("LLM_QUEUE_MAX_BATCH", 8)  # waiting generations before batch items are refused
+LLM_QUEUE_TIMEOUT = env_float("LLM_QUEUE_TIMEOUT", 30) or None  # seconds in line before 503 (0 = wait forever)
+DISCONNECT_POLL_SECONDS = env_float("DISCONNECT_POLL_SECONDS", 0.5)  # how often /query checks for a gone client
+# Latency SLO: if Ollama has not answered (streams: sent a first token) this many seconds after the
+# generation got its slot, the answer is extracted from the sources instead. The wait for the slot is
+# bounded separately by LLM_QUEUE_TIMEOUT (503), so the worst case is roughly the sum of both.
+LLM_LATENCY_BUDGET = env_float("LLM_LATENCY_BUDGET", 20) or None  # 0 = no deadline
+LLM_BREAKER_FAILURES = env_int("LLM_BREAKER_FAILURES", 3)  # consecutive LLM failures/timeouts that open the breaker
+LLM_BREAKER_RESET = env_float("LLM_BREAKER_RESET", 30)  # seconds open before a half-open probe
+FALLBACK_MAX_SENTENCES = env_int("FALLBACK_MAX_SENTENCES", 4)  # sentences in an extractive answer
+BATCH_MAX_QUERIES = env_int("BATCH_MAX_QUERIES", 100)  # questions accepted by one /query/batch call
+BATCH_MAX_CONCURRENCY = env_int("BATCH_MAX_CONCURRENCY", LLM_MAX_CONCURRENCY)  # generations per batch
+API_WORKERS = env_int("API_WORKERS", 1)  # worker processes (`python main.py` starts them; set it for gunicorn -w too)
+# Directory the workers share their Prometheus metrics through (main.py creates one when API_WORKERS > 1)
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+
+def per_worker(total):
+    """One worker's share of a server-wide limit (LLM_MAX_CONCURRENCY, queue sizes), at least 1."""
+    return max(1, total // max(1, API_WORKERS))
+
+# --- Embedding ---
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # torch | onnx | onnx-int8
+EMBEDDING_ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+ENCODE_WORKERS = env_int("ENCODE_WORKERS", 1)  # threads in the dedicated encode executor
+# Ingestion (data_collector/load_to_chroma.py)
+INGEST_BATCH_SIZE = env_int("INGEST_BATCH_SIZE", 1000)  # documents per pipeline batch = length-bucketing window
+INGEST_ENCODE_WORKERS = env_int("INGEST_ENCODE_WORKERS", 1)  # encoding processes; 1 encodes in the loader process
+INGEST_ENCODE_BATCH_SIZE = env_int("INGEST_ENCODE_BATCH_SIZE", 32)  # texts per forward pass
+CHUNK_MAX_TOKENS = env_int("CHUNK_MAX_TOKENS", 256)  # tokens per chunk incl. [CLS]/[SEP] (model limit); 0 = no chunking
+CHUNK_OVERLAP_TOKENS = env_int("CHUNK_OVERLAP_TOKENS", 32)  # tokens shared by consecutive chunks
+CHUNK_QUERY_CANDIDATES = env_int("CHUNK_QUERY_CANDIDATES", 2)  # chunk hits fetched per requested document
+# How API workers get the model: none (each loads its own) | preload (loaded before a
+# forking server such as `gunicorn --preload` forks) | sidecar (embedding_server.py over a Unix socket)
+EMBEDDING_SHARING = os.getenv("EMBEDDING_SHARING", "none")
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", "/tmp/finance-rag-embeddings.sock")
+EMBEDDING_CACHE_SIZE = env_int("EMBEDDING_CACHE_SIZE", 1024)
+EMBEDDING_CACHE_TTL = env_float("EMBEDDING_CACHE_TTL", 0) or None  # seconds; 0 disables expiry
+ENCODE_BATCH_MAX_SIZE = env_int("ENCODE_BATCH_MAX_SIZE", 32)  # questions encoded per call at most
+ENCODE_BATCH_WINDOW_MS = env_float("ENCODE_BATCH_WINDOW_MS", 5)  # how long a batch waits to fill up
+
+# --- Answer cache ---
+ANSWER_CACHE_SIZE = env_int("ANSWER_CACHE_SIZE", 256)
+ANSWER_CACHE_TTL = env_float("ANSWER_CACHE_TTL", 3600) or None  # seconds; 0 disables expiry
+ANSWER_CACHE_THRESHOLD = env_float("ANSWER_CACHE_THRESHOLD", 0.9)  # min cosine similarity for a hit
+
+# --- Context assembly ---
+CONTEXT_TOKEN_BUDGET = env_int("CONTEXT_TOKEN_BUDGET", 1500)  # estimated tokens for all retrieved text
+CONTEXT_DOC_MAX_TOKENS = env_int("CONTEXT_DOC_MAX_TOKENS", 300)  # per document, trimmed to relevant sentences
+CONTEXT_DEDUPE_THRESHOLD = env_float("CONTEXT_DEDUPE_THRESHOLD", 0.85)  # word-overlap ratio for near-duplicates
+CONTEXT_DISTANCE_GAP = env_float("CONTEXT_DISTANCE_GAP", 0.35)  # drop hits this much farther than the best (0 = off)
+CONTEXT_MAX_DISTANCE = env_float("CONTEXT_MAX_DISTANCE", 0) or None  # absolute distance cutoff (0 = off)
+
+# --- Vector store ---
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", "finance_documents")
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")  # chroma (HNSW) | numpy (exact, in-memory) | snapshot (exact, mmap)
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32")  # numpy engine matrix: float32 | float16
+VECTOR_SNAPSHOT_PATH = os.getenv("VECTOR_SNAPSHOT_PATH", os.path.join(CHROMA_PATH, "snapshot"))  # see snapshot.py
+VECTOR_SNAPSHOT_DTYPE = os.getenv("VECTOR_SNAPSHOT_DTYPE", "float16")  # dtype written by the export
+
+
+def embedding_disk_cache_path(chroma_path=CHROMA_PATH):
+    """EMBEDDING_DISK_CACHE_PATH, or embedding_cache.sqlite3 next to (not inside) chroma_db, so a rebuild keeps it."""
+    return os.getenv("EMBEDDING_DISK_CACHE_PATH") or os.path.join(
+        os.path.dirname(os.path.abspath(chroma_path)), "embedding_cache.sqlite3"
+    )
+
+
+# Persistent (model, text hash) -> vector cache used by main.py and load_to_chroma.py (see caches.py)
+EMBEDDING_DISK_CACHE_PATH = embedding_disk_cache_path()
+EMBEDDING_DISK_CACHE_MAX_ENTRIES = env_int("EMBEDDING_DISK_CACHE_MAX_ENTRIES", 200_000)  # ~1.6 KB each; 0 disables
+# HNSW index of the collection, fixed when the collection is created (see benchmarks/hnsw_sweep.py)
+HNSW_M = env_int("HNSW_M", 16)  # graph links per node: recall and index size grow with it
+HNSW_CONSTRUCTION_EF = env_int("HNSW_CONSTRUCTION_EF", 200)  # candidate list while building
+HNSW_SEARCH_EF = env_int("HNSW_SEARCH_EF", 100)  # candidate list per query; Chroma's default of 10 loses recall
+
+
+def hnsw_metadata():
+    """Collection metadata that configures Chroma's HNSW index."""
+    return {"hnsw:M": HNSW_M, "hnsw:construction_ef": HNSW_CONSTRUCTION_EF, "hnsw:search_ef": HNSW_SEARCH_EF}
+
+
+# --- Retrieval ---
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")  # vector | keyword | hybrid (BM25 + vector, RRF-fused)
+RRF_K = env_int("RRF_K", 60)  # reciprocal-rank-fusion damping constant
+HYBRID_CANDIDATES = env_int("HYBRID_CANDIDATES", 3)  # each retriever fetches n_results * this before fusion
+
+# --- Queries ---
+# Shown as buttons in the Streamlit UI and used to prewarm the query caches at startup
+SAMPLE_QUESTIONS = [
+    "What do investors think about the current crypto market conditions?",
+    "What are people saying about the S&P 500 performance lately?",
+    "What are investors saying about the current state of the real estate market?",
+    "Has JPMorgan Chase made any major announcements in recent weeks?",
+]
+# One query per line; also prewarmed at startup
+FREQUENT_QUERIES_FILE = os.getenv("FREQUENT_QUERIES_FILE", "./frequent_queries.txt")
+
+
+def prewarm_queries():
+    """Sample questions plus the configured frequent queries, without duplicates."""
+    return list(dict.fromkeys(SAMPLE_QUESTIONS + read_lines(FREQUENT_QUERIES_FILE)))
@@ -0,0 +1,255 @@
+# snapshot.py
+"""
+Read-only embedding snapshot of the collection, shared by every server process.
+
+    <snapshot_dir>/manifest.json           - count, dim, dtype, space, source version, file names
+    <snapshot_dir>/embeddings-<stamp>.npy  - (N, dim) float16/float32 matrix, plain .npy
+    <snapshot_dir>/documents-<stamp>.bin   - document texts, UTF-8, back to back
+    <snapshot_dir>/offsets-<stamp>.npy     - (N + 1,) int64 byte offsets of each text in the .bin
+    <snapshot_dir>/columns-<stamp>.json    - ids and metadata stored column by column
+
+Servers open the .npy and .bin files with mmap_mode="r": neither the matrix nor
+the corpus text is copied into the process, so N uvicorn workers share one
+page-cache copy and startup does not wait for Chroma. Only the ids and the
+(small) filter columns are parsed into each worker. The manifest is replaced last (atomic rename), so a reader
+never sees a half-written snapshot; files of older snapshots are removed after
+the switch (processes that still map them keep reading them until they reload).
+
+Export after each ingest (load_to_chroma.py does this) or by hand:
+    python snapshot.py --dtype float16
+"""
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+MANIFEST = "manifest.json"
+
+
+def _key(value):
+    # True == 1 for dicts and sets; keep booleans apart from numbers
+    return (isinstance(value, bool), value)
+
+
+class MappedDocuments:
+    """
+    Read-only list of document texts over a memory-mapped UTF-8 blob and its offsets.
+
+    A text is decoded when it is read (search hits), so the corpus stays in the
+    shared page cache instead of every worker's heap.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob        # uint8 memmap (or empty array)
+        self.offsets = offsets  # int64, len(self) + 1
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return bytes(self.blob[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    @classmethod
+    def open(cls, blob_path, offsets_path):
+        offsets = np.load(offsets_path, mmap_mode="r")
+        # np.memmap refuses empty files
+        blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if offsets[-1] else np.zeros(0, dtype=np.uint8)
+        return cls(blob, offsets)
+
+
+class ColumnarMetadata:
+    """
+    Per-document metadata kept as one list per field instead of one dict per document.
+
+    Behaves like a list of dicts for the rows that are read (search hits) and
+    evaluates build_where() clauses column-wise for the filter masks. Filters
+    run on typed arrays built on first use: equality on the column
+    dictionary-encoded as int32 codes (-1 = missing), ranges on a float64
+    copy (NaN = missing or not a number, which no comparison matches).
+    """
+
+    def __init__(self, columns, count):
+        self.columns = columns  # field -> list of values (None where a document lacks the field)
+        self.count = count
+        self._codes = {}    # field -> (int32 codes, {value key: code})
+        self._numbers = {}  # field -> float64 values
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, row):
+        return {field: values[row] for field, values in self.columns.items() if values[row] is not None}
+
+    def __iter__(self):
+        return (self[row] for row in range(self.count))
+
+    def _encoded(self, field):
+        if field not in self._codes:
+            vocabulary, codes = {}, np.full(self.count, -1, dtype=np.int32)
+            for row, value in enumerate(self.columns.get(field, ())):
+                if value is not None:
+                    codes[row] = vocabulary.setdefault(_key(value), len(vocabulary))
+            self._codes[field] = (codes, vocabulary)
+        return self._codes[field]
+
+    def _numeric(self, field):
+        if field not in self._numbers:
+            self._numbers[field] = np.array(
+                [value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+                 for value in self.columns.get(field, [None] * self.count)],
+                dtype=np.float64,
+            )
+        return self._numbers[field]
+
+    def _matches(self, field, operands):
+        """Rows whose value equals one of `operands` (same type), via the code dictionary."""
+        codes, vocabulary = self._encoded(field)
+        wanted = [vocabulary[key] for key in map(_key, operands) if key in vocabulary]
+        if not wanted:
+            return np.zeros(self.count, dtype=bool)
+        if len(wanted) == 1:
+            return codes == wanted[0]
+        return np.isin(codes, np.asarray(wanted, dtype=np.int32))
+
+    def mask(self, where):
+        """Boolean row mask for a build_where() clause."""
+        if not where:
+            return np.ones(self.count, dtype=bool)
+        if "$and" in where:
+            mask = np.ones(self.count, dtype=bool)
+            for clause in where["$and"]:
+                mask &= self.mask(clause)
+            return mask
+        (field, condition), = where.items()
+        mask = np.ones(self.count, dtype=bool)
+        for op, operand in condition.items():
+            if op == "$in":
+                mask &= self._matches(field, operand)
+            elif op == "$eq":
+                mask &= self._matches(field, [operand])
+            elif op == "$gte":
+                mask &= self._numeric(field) >= operand
+            elif op == "$lte":
+                mask &= self._numeric(field) <= operand
+        return mask
+
+    @classmethod
+    def from_dicts(cls, metadatas):
+        fields = sorted({field for metadata in metadatas for field in metadata})
+        columns = {field: [metadata.get(field) for metadata in metadatas] for field in fields}
+        return cls(columns, len(metadatas))
+
+
+def export_snapshot(store, snapshot_dir, dtype="float16", page_size=1000):
+    """
+    Writes every embedding of a VectorStore (normally the Chroma one) to snapshot_dir.
+
+    The matrix is streamed page by page into a .npy memmap, so the export never
+    holds more than one page of embeddings in memory. Returns the manifest.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = store.version()
+    count = store.count()
+    stamp = time.strftime("%Y%m%d%H%M%S") + f"-{os.getpid()}"
+    embeddings_file, columns_file = f"embeddings-{stamp}.npy", f"columns-{stamp}.json"
+    documents_file, offsets_file = f"documents-{stamp}.bin", f"offsets-{stamp}.npy"
+
+    ids, metadatas, offsets = [], [], [0]
+    matrix = None
+    with open(os.path.join(snapshot_dir, documents_file), 'wb') as blob:
+        for offset in range(0, count, page_size):
+            page = store.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+            block = np.asarray(page['embeddings'], dtype=dtype)
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(os.path.join(snapshot_dir, embeddings_file), mode="w+",
+                                                   dtype=dtype, shape=(count, block.shape[1]))
+            matrix[len(ids):len(ids) + len(block)] = block
+            ids.extend(page['ids'])
+            metadatas.extend(page['metadatas'])
+            for document in page['documents']:
+                encoded = (document or "").encode('utf-8')
+                blob.write(encoded)
+                offsets.append(offsets[-1] + len(encoded))
+    np.save(os.path.join(snapshot_dir, offsets_file), np.asarray(offsets, dtype=np.int64))
+    if matrix is None:
+        matrix = np.lib.format.open_memmap(os.path.join(snapshot_dir, embeddings_file), mode="w+",
+                                           dtype=dtype, shape=(0, 0))
+    matrix.flush()
+    dim = int(matrix.shape[1])
+    del matrix
+
+    with open(os.path.join(snapshot_dir, columns_file), 'w', encoding='utf-8') as f:
+        json.dump({"ids": ids, "metadata": ColumnarMetadata.from_dicts(metadatas).columns}, f, ensure_ascii=False)
+
+    manifest = {
+        "count": len(ids), "dim": dim, "dtype": dtype, "space": store.space,
+        "source_version": list(version), "created_at": time.time(),
+        "embeddings_file": embeddings_file, "columns_file": columns_file,
+        "documents_file": documents_file, "offsets_file": offsets_file,
+    }
+    tmp_path = os.path.join(snapshot_dir, MANIFEST + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(snapshot_dir, MANIFEST))
+
+    current = (embeddings_file, columns_file, documents_file, offsets_file)
+    for name in os.listdir(snapshot_dir):
+        if name.startswith(("embeddings-", "columns-", "documents-", "offsets-")) and name not in current:
+            os.remove(os.path.join(snapshot_dir, name))
+    return manifest
+
+
+def read_manifest(snapshot_dir):
+    """The current manifest, or None if no snapshot was exported."""
+    path = os.path.join(snapshot_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_snapshot(snapshot_dir, manifest=None):
+    """(manifest, ids, matrix, documents, metadatas); the matrix and the documents are read-only memmaps."""
+    manifest = manifest or read_manifest(snapshot_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No embedding snapshot in {snapshot_dir}; run `python snapshot.py` first")
+    matrix = np.load(os.path.join(snapshot_dir, manifest["embeddings_file"]), mmap_mode="r")
+    with open(os.path.join(snapshot_dir, manifest["columns_file"]), 'r', encoding='utf-8') as f:
+        columns = json.load(f)
+    metadatas = ColumnarMetadata(columns["metadata"], len(columns["ids"]))
+    if "documents_file" in manifest:
+        documents = MappedDocuments.open(os.path.join(snapshot_dir, manifest["documents_file"]),
+                                         os.path.join(snapshot_dir, manifest["offsets_file"]))
+    else:
+        documents = columns["documents"]  # exported before the texts moved out of the sidecar
+    return manifest, columns["ids"], matrix, documents, metadatas
+
+
+def main():
+    from settings import CHROMA_PATH, COLLECTION_NAME, VECTOR_SNAPSHOT_DTYPE, VECTOR_SNAPSHOT_PATH
+    from vector_store import ChromaVectorStore
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chroma-path", default=CHROMA_PATH)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--output", default=VECTOR_SNAPSHOT_PATH, help="Snapshot directory")
+    parser.add_argument("--dtype", choices=["float16", "float32"], default=VECTOR_SNAPSHOT_DTYPE)
+    args = parser.parse_args()
+
+    store = ChromaVectorStore.open(args.chroma_path, args.collection)
+    print(f"📦 Exporting {store.count()} embeddings to {args.output} ({args.dtype})...")
+    started = time.perf_counter()
+    manifest = export_snapshot(store, args.output, dtype=args.dtype)
+    size_mb = os.path.getsize(os.path.join(args.output, manifest["embeddings_file"])) / 1e6
+    print(f"✓ {manifest['count']} x {manifest['dim']} matrix ({size_mb:.1f} MB) "
+          f"written in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+# vector_store.py
+"""
+Vector search behind one small interface, so the API, the CLI tools and the loader
+do not depend on which engine answers a query.
+
+    chroma - the persistent Chroma collection (HNSW index, approximate, SQLite-backed)
+    numpy    - all embeddings in one contiguous float32/float16 matrix held in RAM and
+               searched exactly with a single matrix product; loaded from the Chroma
+               collection, which stays the store of record for writes
+    snapshot - the same exact search over a read-only memory-mapped export
+               (snapshot.py), shared by all server processes through the page cache
+
+At a few thousand to a few hundred thousand 384-dim vectors, one BLAS product over
+the matrix is faster than an HNSW lookup plus the SQLite round trip for the
+documents, and it returns exact neighbours. Results use the collection.query /
+collection.get dict shapes, so fusion and the context builder work with either engine.
+"""
+import os
+import json
+import threading
+from collections import OrderedDict
+
+import chromadb
+import numpy as np
+
+from filters import matches_where
+from settings import (
+    CHROMA_PATH, COLLECTION_NAME, VECTOR_SNAPSHOT_PATH, VECTOR_STORE, VECTOR_STORE_DTYPE,
+)
+from snapshot import load_snapshot, read_manifest
+
+ENGINES = ("chroma", "numpy", "snapshot")
+QUERY_INCLUDE = ("documents", "metadatas", "distances")
+CHROMA_MAX_BATCH = 5461  # rows per write call of the default sqlite backend, if the client cannot tell
+
+
+class VectorStore:
+    """Operations main.py, the loader and the CLI tools need from a vector engine."""
+
+    engine = None
+
+    @property
+    def space(self):
+        """Distance function: l2 (Chroma's default), cosine or ip."""
+        return "l2"
+
+    def count(self):
+        raise NotImplementedError
+
+    def query(self, query_embeddings, n_results, where=None, include=QUERY_INCLUDE):
+        """Nearest neighbours for one or many vectors, in collection.query shape (one list per vector)."""
+        raise NotImplementedError
+
+    def get(self, ids=None, include=("documents", "metadatas"), limit=None, offset=None):
+        """Documents by id, or a page of all documents, in collection.get shape."""
+        raise NotImplementedError
+
+    def add(self, ids, embeddings, documents, metadatas):
+        raise NotImplementedError
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        """Adds new ids and overwrites existing ones."""
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def version(self):
+        """Changes whenever the stored documents change."""
+        raise NotImplementedError
+
+    def refresh(self):
+        """Picks up writes made by other processes (e.g. the loader); True if anything was reloaded."""
+        return False
+
+    def stats(self):
+        return {"engine": self.engine, "documents": self.count(), "space": self.space}
+
+
+class ChromaVectorStore(VectorStore):
+    """The persistent Chroma collection used so far."""
+
+    engine = "chroma"
+
+    def __init__(self, collection, chroma_path=CHROMA_PATH, client=None):
+        self.collection = collection
+        self.chroma_path = chroma_path
+        get_max = getattr(client, "get_max_batch_size", None)
+        self.max_batch_size = get_max() if get_max else CHROMA_MAX_BATCH
+
+    @classmethod
+    def open(cls, chroma_path=CHROMA_PATH, name=COLLECTION_NAME, create=False, metadata=None):
+        """Opens the collection; with create=True it is created (with `metadata`) if missing."""
+        client = chromadb.PersistentClient(path=chroma_path)
+        if create:
+            collection = client.get_or_create_collection(name=name, metadata=metadata)
+        else:
+            collection = client.get_collection(name)
+        return cls(collection, chroma_path, client)
+
+    @property
+    def space(self):
+        return (self.collection.metadata or {}).get("hnsw:space", "l2")
+
+    @property
+    def metadata(self):
+        return self.collection.metadata or {}
+
+    def count(self):
+        return self.collection.count()
+
+    def query(self, query_embeddings, n_results, where=None, include=QUERY_INCLUDE):
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=list(include),
+        )
+
+    def get(self, ids=None, include=("documents", "metadatas"), limit=None, offset=None):
+        return self.collection.get(ids=ids, include=list(include), limit=limit, offset=offset)
+
+    def _slices(self, count):
+        # Chroma rejects a write of more rows than max_batch_size (chunked documents get there quickly)
+        return (slice(start, start + self.max_batch_size) for start in range(0, count, self.max_batch_size))
+
+    def add(self, ids, embeddings, documents, metadatas):
+        for rows in self._slices(len(ids)):
+            self.collection.add(ids=ids[rows], embeddings=embeddings[rows], documents=documents[rows],
+                                metadatas=metadatas[rows])
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        for rows in self._slices(len(ids)):
+            self.collection.upsert(ids=ids[rows], embeddings=embeddings[rows], documents=documents[rows],
+                                   metadatas=metadatas[rows])
+
+    def delete(self, ids):
+        for rows in self._slices(len(ids)):
+            self.collection.delete(ids=ids[rows])
+
+    def version(self):
+        sqlite_path = os.path.join(self.chroma_path, "chroma.sqlite3")
+        mtime = os.path.getmtime(sqlite_path) if os.path.exists(sqlite_path) else None
+        return (self.collection.count(), mtime)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact search over an in-memory embedding matrix.
+
+    Args:
+        ids, documents, metadatas: Per-row document data
+        matrix: (N, dim) embeddings, float32 or float16 (half the memory, upcast per block at query time)
+        space: Distance function of the source collection, so distances match Chroma's
+        source: Optional ChromaVectorStore the data was loaded from (used by refresh/add)
+    """
+
+    engine = "numpy"
+    BLOCK_ROWS = 16384  # float16 rows upcast per block
+    MASK_CACHE_SIZE = 128
+
+    def __init__(self, ids, matrix, documents, metadatas, space="l2", source=None, loaded_version=None):
+        self.source = source
+        self._space = space
+        self._lock = threading.Lock()
+        self._masks = OrderedDict()  # json(where) -> boolean row mask
+        self._set_data(ids, matrix, documents, metadatas, loaded_version)
+
+    def _set_data(self, ids, matrix, documents, metadatas, loaded_version):
+        # A read-only memmap (snapshot engine) is used as is; it is already contiguous
+        if not isinstance(matrix, np.memmap):
+            matrix = np.ascontiguousarray(matrix)
+        norms = np.zeros(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), self.BLOCK_ROWS):
+            norms[start:start + self.BLOCK_ROWS] = np.linalg.norm(
+                matrix[start:start + self.BLOCK_ROWS].astype(np.float32), axis=1)
+        # One assignment, so a query running during refresh() sees either the old or the new data
+        self._data = {
+            "ids": ids,
+            "index": {doc_id: row for row, doc_id in enumerate(ids)},
+            "matrix": matrix,
+            "norms": norms,
+            "documents": documents,
+            "metadatas": metadatas,
+        }
+        self.loaded_version = loaded_version
+        with self._lock:
+            self._masks.clear()
+
+    @classmethod
+    def from_chroma(cls, source, dtype=VECTOR_STORE_DTYPE, page_size=1000):
+        """Loads every embedding, document and metadata of a ChromaVectorStore into memory."""
+        version = source.version()
+        ids, documents, metadatas, matrix = cls._read_source(source, dtype, page_size)
+        return cls(ids, matrix, documents, metadatas, space=source.space, source=source, loaded_version=version)
+
+    @staticmethod
+    def _read_source(source, dtype, page_size):
+        ids, documents, metadatas, blocks = [], [], [], []
+        for offset in range(0, source.count(), page_size):
+            page = source.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+            ids.extend(page['ids'])
+            documents.extend(page['documents'])
+            metadatas.extend(page['metadatas'])
+            blocks.append(np.asarray(page['embeddings'], dtype=dtype))
+        matrix = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=dtype)
+        return ids, documents, metadatas, matrix
+
+    @property
+    def space(self):
+        return self._space
+
+    @property
+    def dtype(self):
+        return self._data["matrix"].dtype
+
+    def count(self):
+        return len(self._data["ids"])
+
+    def _mask(self, data, where):
+        """Boolean row mask for a where clause, cached per clause (filters repeat across requests)."""
+        key = json.dumps(where, sort_keys=True)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        if hasattr(data["metadatas"], "mask"):
+            mask = data["metadatas"].mask(where)  # columnar metadata (snapshot engine)
+        else:
+            mask = np.fromiter((matches_where(meta, where) for meta in data["metadatas"]),
+                               dtype=bool, count=len(data["metadatas"]))
+        with self._lock:
+            if data is self._data:
+                self._masks[key] = mask
+                while len(self._masks) > self.MASK_CACHE_SIZE:
+                    self._masks.popitem(last=False)
+        return mask
+
+    def _dots(self, queries, matrix):
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+        dots = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), self.BLOCK_ROWS):
+            block = matrix[start:start + self.BLOCK_ROWS].astype(np.float32)
+            dots[:, start:start + len(block)] = queries @ block.T
+        return dots
+
+    def distances(self, queries, rows=None, data=None):
+        """(num_queries, num_rows) distances in the store's space; rows=None means every document."""
+        data = self._data if data is None else data
+        matrix, norms = data["matrix"], data["norms"]
+        if rows is not None:
+            matrix, norms = matrix[rows], norms[rows]
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        dots = self._dots(queries, matrix)
+        if self._space == "cosine":
+            query_norms = np.linalg.norm(queries, axis=1)
+            return 1 - dots / np.maximum(query_norms[:, None] * norms[None, :], 1e-12)
+        if self._space == "ip":
+            return 1 - dots
+        # Squared L2, like Chroma/hnswlib
+        return np.maximum((queries ** 2).sum(axis=1)[:, None] + (norms ** 2)[None, :] - 2 * dots, 0)
+
+    def query(self, query_embeddings, n_results, where=None, include=QUERY_INCLUDE):
+        data = self._data
+        rows = np.flatnonzero(self._mask(data, where)) if where else None
+        num_queries = len(query_embeddings)
+        available = len(data["ids"]) if rows is None else len(rows)
+        k = min(n_results, available)
+
+        results = {"ids": [[] for _ in range(num_queries)]}
+        for key in include:
+            results[key] = [[] for _ in range(num_queries)]
+        if k == 0:
+            return results
+
+        distances = self.distances(query_embeddings, rows, data)
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k] if k < available else \
+            np.tile(np.arange(available), (num_queries, 1))
+        order = np.take_along_axis(distances, top, axis=1).argsort(axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+
+        for q, hits in enumerate(top):
+            doc_rows = hits if rows is None else rows[hits]
+            results["ids"][q] = [data["ids"][row] for row in doc_rows]
+            if "documents" in include:
+                results["documents"][q] = [data["documents"][row] for row in doc_rows]
+            if "metadatas" in include:
+                results["metadatas"][q] = [data["metadatas"][row] for row in doc_rows]
+            if "distances" in include:
+                results["distances"][q] = [float(distances[q, hit]) for hit in hits]
+            if "embeddings" in include:
+                results["embeddings"][q] = [data["matrix"][row].astype(np.float32) for row in doc_rows]
+        return results
+
+    def get(self, ids=None, include=("documents", "metadatas"), limit=None, offset=None):
+        data = self._data
+        if ids is not None:
+            doc_rows = [data["index"][doc_id] for doc_id in ids if doc_id in data["index"]]
+        else:
+            start = offset or 0
+            stop = len(data["ids"]) if limit is None else min(len(data["ids"]), start + limit)
+            doc_rows = range(start, stop)
+
+        results = {"ids": [data["ids"][row] for row in doc_rows]}
+        if "documents" in include:
+            results["documents"] = [data["documents"][row] for row in doc_rows]
+        if "metadatas" in include:
+            results["metadatas"] = [data["metadatas"][row] for row in doc_rows]
+        if "embeddings" in include:
+            results["embeddings"] = [data["matrix"][row].astype(np.float32) for row in doc_rows]
+        return results
+
+    def add(self, ids, embeddings, documents, metadatas):
+        """Writes go to the Chroma source (the store of record), then the matrix is reloaded."""
+        if self.source is None:
+            raise RuntimeError("This NumPy store has no Chroma source to write to")
+        self.source.add(ids, embeddings, documents, metadatas)
+        self.refresh()
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if self.source is None:
+            raise RuntimeError("This NumPy store has no Chroma source to write to")
+        self.source.upsert(ids, embeddings, documents, metadatas)
+        self.refresh()
+
+    def delete(self, ids):
+        if self.source is None:
+            raise RuntimeError("This NumPy store has no Chroma source to write to")
+        self.source.delete(ids)
+        self.refresh()
+
+    def version(self):
+        return self.source.version() if self.source is not None else self.loaded_version
+
+    def refresh(self):
+        if self.source is None:
+            return False
+        version = self.source.version()
+        if version == self.loaded_version:
+            return False
+        ids, documents, metadatas, matrix = self._read_source(self.source, self.dtype, 1000)
+        self._set_data(ids, matrix, documents, metadatas, version)
+        return True
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({"dtype": str(self.dtype), "matrix_mb": round(self._data["matrix"].nbytes / 1e6, 2)})
+        return stats
+
+
+class SnapshotVectorStore(NumpyVectorStore):
+    """
+    NumpyVectorStore over a memory-mapped snapshot (see snapshot.py).
+
+    Opening it only maps the file and reads the id/metadata sidecar, so startup is
+    near-instant and every worker shares the same physical pages. It is read-only:
+    refresh() switches to a newer export when the manifest changes.
+    """
+
+    engine = "snapshot"
+
+    def __init__(self, snapshot_dir):
+        self.snapshot_dir = snapshot_dir
+        manifest, ids, matrix, documents, metadatas = load_snapshot(snapshot_dir)
+        super().__init__(ids, matrix, documents, metadatas, space=manifest["space"],
+                         loaded_version=self._manifest_version(manifest))
+
+    @staticmethod
+    def _manifest_version(manifest):
+        return (manifest["count"], manifest["embeddings_file"])
+
+    def add(self, ids, embeddings, documents, metadatas):
+        raise RuntimeError("The snapshot is read-only; write to Chroma and re-export it (python snapshot.py)")
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.add(ids, embeddings, documents, metadatas)
+
+    def delete(self, ids):
+        self.add(ids, None, None, None)
+
+    def version(self):
+        manifest = read_manifest(self.snapshot_dir)
+        return self._manifest_version(manifest) if manifest else self.loaded_version
+
+    def refresh(self):
+        manifest = read_manifest(self.snapshot_dir)
+        if manifest is None or self._manifest_version(manifest) == self.loaded_version:
+            return False
+        manifest, ids, matrix, documents, metadatas = load_snapshot(self.snapshot_dir, manifest)
+        self._space = manifest["space"]
+        self._set_data(ids, matrix, documents, metadatas, self._manifest_version(manifest))
+        return True
+
+    def stats(self):
+        stats = super().stats()
+        stats["snapshot"] = self.snapshot_dir
+        return stats
+
+
+def open_vector_store(engine=None, chroma_path=CHROMA_PATH, name=COLLECTION_NAME, dtype=VECTOR_STORE_DTYPE,
+                      snapshot_dir=VECTOR_SNAPSHOT_PATH):
+    """
+    Args:
+        engine: One of ENGINES (defaults to the VECTOR_STORE setting)
+        dtype: Matrix dtype of the numpy engine (float32 or float16)
+        snapshot_dir: Export read by the snapshot engine
+    """
+    engine = engine or VECTOR_STORE
+    if engine == "snapshot":
+        return SnapshotVectorStore(snapshot_dir)
+    chroma = ChromaVectorStore.open(chroma_path, name)
+    if engine == "chroma":
+        return chroma
+    if engine == "numpy":
+        return NumpyVectorStore.from_chroma(chroma, dtype=dtype)
+    raise ValueError(f"Unknown vector store {engine!r}; expected one of {ENGINES}")